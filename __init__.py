@@ -18,6 +18,10 @@ from folder_paths import add_model_folder_path, get_filename_list, get_folder_pa
 from tqdm import tqdm
 
 from . import custom_routes
+from .utils import hashing as shellagent_hashing
+# comfy-nodes are imported as top-level modules, and ComfyUI ships its own
+# top-level `utils` package, so the hash engine is exposed under a unique name
+sys.modules.setdefault("shellagent_hashing", shellagent_hashing)
 # import routes
 
 ag_path = os.path.join(os.path.dirname(__file__))
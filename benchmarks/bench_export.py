@@ -0,0 +1,268 @@
+"""
+Offline benchmark of the export path: resolve_dependencies (and optionally the
+/shellagent/export route) against a synthetic ComfyUI tree, with the ComfyUI
+modules replaced by benchmarks/stubs and the model searcher / store replaced
+by the stand-ins of mock_servers.py. Nothing leaves the machine.
+
+    python benchmarks/bench_export.py
+    python benchmarks/bench_export.py --checkpoints 8 --checkpoint-mb 6144 --copies 16 --runs 3
+    python benchmarks/bench_export.py --endpoint --json bench.json
+
+The first run starts from empty caches (cold), the following runs reuse them
+(warm). For each run the time of every export stage and the peak memory are
+reported, next to the dry-run estimate.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_ROOT = os.path.dirname(BENCH_DIR)
+PACKAGE = "shellagent_bench_plugin"
+STAGES = ["collect", "comfyui_version", "custom_nodes", "pypi", "models", "files"]
+
+sys.path.insert(0, BENCH_DIR)
+from synthetic import make_comfy_tree, make_workflow  # noqa: E402
+
+
+def load_plugin_module(name):
+    # the plugin uses relative imports, so it is loaded as a package without running its __init__
+    # (which would import the comfy-nodes and their torch dependencies)
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [PLUGIN_ROOT]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def measure(fn, trace_memory=True):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+    return result, {
+        "seconds": elapsed,
+        "peak_traced_mb": peak / 1024 ** 2 if peak is not None else None,
+        "max_rss_mb": max_rss_mb(),
+    }
+
+
+def stage_seconds(stage_timings):
+    return {name: end - begin for name, (begin, end) in stage_timings.items()}
+
+
+def bench_resolve(prompt, runs, trace_memory):
+    dependency_checker = load_plugin_module("dependency_checker")
+    results = []
+    for i in range(runs):
+        phases = {}
+        start = time.perf_counter()
+
+        def on_progress(phase, **info):
+            phases.setdefault(phase, time.perf_counter() - start)
+
+        output, stats = measure(
+            lambda: dependency_checker.resolve_dependencies(
+                prompt, {"models": {}, "custom_nodes": {}}, progress_callback=on_progress),
+            trace_memory=trace_memory,
+        )
+        results.append({
+            "run": "cold" if i == 0 else "warm",
+            **stats,
+            "stages": stage_seconds(output["stage_timings"]),
+            "first_progress": phases,
+            "models": len(output["dependencies"]["models"]),
+            "files": len(output["dependencies"]["files"]),
+        })
+    return results
+
+
+async def _bench_endpoint(app, prompt, runs):
+    from aiohttp.test_utils import TestClient, TestServer
+
+    results = []
+    async with TestClient(TestServer(app)) as client:
+        for i in range(runs):
+            # a cheap request every 10ms shows whether the export blocks the event loop
+            stalls = []
+            export_done = asyncio.Event()
+
+            async def probe():
+                while not export_done.is_set():
+                    probe_start = time.perf_counter()
+                    response = await client.get("/shellagent/export/not-a-job")
+                    await response.read()
+                    stalls.append(time.perf_counter() - probe_start)
+                    await asyncio.sleep(0.01)
+
+            probe_task = asyncio.ensure_future(probe())
+            start = time.perf_counter()
+            response = await client.post("/shellagent/export", json={"prompt": prompt, "client_id": "bench"})
+            data = await response.json()
+            elapsed = time.perf_counter() - start
+            export_done.set()
+            await probe_task
+            if not data.get("success"):
+                raise RuntimeError(f"export failed: {data.get('message')}\n{data.get('message_detail', '')}")
+            results.append({
+                "run": i + 1,  # the caches were already filled by the resolve runs
+                "seconds": elapsed,
+                "status": response.status,
+                "max_probe_latency": max(stalls) if stalls else None,
+                "max_rss_mb": max_rss_mb(),
+            })
+    return results
+
+
+def bench_endpoint(prompt, runs):
+    load_plugin_module("custom_routes")
+    import server
+    return asyncio.run(_bench_endpoint(server.PromptServer.instance.make_app(), prompt, runs))
+
+
+def apparent_size(root):
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
+
+
+def print_report(report):
+    tree = report["tree"]
+    print(f"tree: {tree['root']} ({tree['apparent_gb']:.1f} GB apparent), prompt: {report['prompt_nodes']} nodes")
+    estimate = report["estimate"]
+    print(
+        f"dry run: {estimate['seconds']:.3f}s, predicted export {estimate['predicted_seconds']:.2f}s, "
+        f"{estimate['models']} models ({estimate['hash_bytes'] / 1024 ** 3:.2f} GB to hash), "
+        f"{estimate['files']} files ({estimate['upload_bytes'] / 1024 ** 2:.1f} MB to upload)"
+    )
+    header = f"{'run':<6}{'total':>9}" + "".join(f"{name:>17}" for name in STAGES) + f"{'peak traced':>13}{'max rss':>10}"
+    print(header)
+    for run in report["resolve"]:
+        peak = f"{run['peak_traced_mb']:.1f}MB" if run["peak_traced_mb"] is not None else "-"
+        print(
+            f"{run['run']:<6}{run['seconds']:>8.3f}s"
+            + "".join(f"{run['stages'].get(name, 0):>16.3f}s" for name in STAGES)
+            + f"{peak:>13}{run['max_rss_mb']:>8.1f}MB"
+        )
+    storage = report["storage"]
+    if storage["bytes_per_sec"] is not None:
+        print(
+            f"storage ({storage['backend']}): {storage['files_uploaded']} files uploaded, {storage['files_cached']} already stored, "
+            f"{storage['bytes'] / 1024 ** 2:.1f} MB at {storage['bytes_per_sec'] / 1024 ** 2:.1f} MB/s"
+        )
+    for run in report.get("endpoint", []):
+        print(
+            f"endpoint run {run['run']}: {run['seconds']:.3f}s (HTTP {run['status']}), "
+            f"max event loop probe latency {run['max_probe_latency'] or 0:.3f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", help="where the synthetic ComfyUI tree is created (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the temp dirs after the run")
+    parser.add_argument("--checkpoints", type=int, default=4)
+    parser.add_argument("--checkpoint-mb", type=int, default=2048)
+    parser.add_argument("--loras", type=int, default=8)
+    parser.add_argument("--lora-mb", type=int, default=128)
+    parser.add_argument("--custom-nodes", type=int, default=4)
+    parser.add_argument("--inputs", type=int, default=4)
+    parser.add_argument("--input-kb", type=int, default=512)
+    parser.add_argument("--filler-dirs", type=int, default=50)
+    parser.add_argument("--filler-files", type=int, default=20)
+    parser.add_argument("--copies", type=int, default=4, help="img2img pipelines in the workflow")
+    parser.add_argument("--runs", type=int, default=2, help="the first run is cold, the others warm")
+    parser.add_argument("--remote-delay", type=float, default=0.0, help="seconds each stand-in request takes")
+    parser.add_argument("--endpoint", action="store_true", help="also benchmark POST /shellagent/export")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip tracemalloc, which slows python code down")
+    parser.add_argument("--json", help="write the full report to this file")
+    parser.add_argument("--storage", choices=["http", "local", "s3"], default="http", help="storage backend the files are uploaded to")
+    parser.add_argument("--verbose", action="store_true", help="show what the plugin prints during the export")
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix="shellagent-bench-")
+    cache_dir = tempfile.mkdtemp(prefix="shellagent-bench-cache-")
+    try:
+        tree = make_comfy_tree(
+            root, checkpoints=args.checkpoints, checkpoint_mb=args.checkpoint_mb, loras=args.loras,
+            lora_mb=args.lora_mb, custom_nodes=args.custom_nodes, inputs=args.inputs, input_kb=args.input_kb,
+            filler_dirs=args.filler_dirs, filler_files=args.filler_files,
+        )
+        prompt = make_workflow(tree, copies=args.copies)
+
+        # everything the plugin reads at import time has to be set before it is loaded
+        os.environ["SHELLAGENT_BENCH_COMFY_ROOT"] = root
+        os.environ["SHELLAGENT_CACHE_DIR"] = cache_dir
+        sys.path.insert(0, os.path.join(BENCH_DIR, "stubs"))
+        mock_servers = load_plugin_module("mock_servers")
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with output, mock_servers.model_searcher(delay=args.remote_delay) as searcher, \
+                mock_servers.store(delay=args.remote_delay) as store, mock_servers.s3(delay=args.remote_delay) as s3:
+            os.environ["SHELLAGENT_MODEL_SEARCHER_URL"] = searcher.url + "/search_urls"
+            os.environ["SHELLAGENT_STORE_URL"] = store.url + "/public/v1/store"
+            os.environ["SHELLAGENT_STORAGE_BACKEND"] = args.storage
+            os.environ["SHELLAGENT_LOCAL_STORE_DIR"] = os.path.join(cache_dir, "store")
+            os.environ.update({
+                "SHELLAGENT_S3_ENDPOINT": s3.url, "SHELLAGENT_S3_BUCKET": "bench",
+                "AWS_ACCESS_KEY_ID": "bench", "AWS_SECRET_ACCESS_KEY": "bench",
+            })
+
+            dependency_checker = load_plugin_module("dependency_checker")
+            estimate, estimate_stats = measure(lambda: dependency_checker.estimate_export_cost(prompt), trace_memory=False)
+            report = {
+                "config": vars(args),
+                "tree": {"root": root, "apparent_gb": apparent_size(root) / 1024 ** 3},
+                "prompt_nodes": len(prompt),
+                "estimate": {
+                    "seconds": estimate_stats["seconds"],
+                    **{k: v for k, v in estimate.items() if k != "hash_cache_misses"},
+                },
+                "resolve": bench_resolve(prompt, args.runs, trace_memory=not args.no_tracemalloc),
+            }
+            if args.endpoint:
+                report["endpoint"] = bench_endpoint(prompt, args.runs)
+            report["storage"] = {"backend": args.storage, **load_plugin_module("storage_backends").get_storage_backend().stats.to_dict()}
+            report["stand_ins"] = {
+                "model_searcher_lookups": len(searcher.state.get("lookups", [])),
+                "store_uploads": store.state.get("uploads", 0),
+                "store_bytes": store.state.get("bytes_received", 0),
+                "s3_bytes": s3.state.get("bytes_received", 0),
+            }
+    finally:
+        if not args.keep:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            if args.root is None:
+                shutil.rmtree(root, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Stand-in for ComfyUI's `execution`; the export routes only import it."""
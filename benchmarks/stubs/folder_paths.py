@@ -0,0 +1,57 @@
+"""Stand-in for ComfyUI's `folder_paths`, rooted at $SHELLAGENT_BENCH_COMFY_ROOT."""
+import os
+
+base_path = os.environ["SHELLAGENT_BENCH_COMFY_ROOT"]
+models_dir = os.path.join(base_path, "models")
+
+folder_names_and_paths = {
+    name: ([os.path.join(models_dir, name)], set())
+    for name in ["checkpoints", "configs", "loras", "vae", "clip", "unet", "controlnet", "upscale_models", "embeddings", "diffusers"]
+}
+folder_names_and_paths["custom_nodes"] = ([os.path.join(base_path, "custom_nodes")], set())
+
+legacy_names = {"unet": "diffusion_models", "clip": "text_encoders"}
+
+
+def map_legacy(folder_name):
+    return legacy_names.get(folder_name, folder_name)
+
+
+def get_folder_paths(folder_name):
+    return folder_names_and_paths[map_legacy(folder_name)][0][:]
+
+
+def add_model_folder_path(folder_name, full_folder_path):
+    folder_names_and_paths.setdefault(folder_name, ([], set()))[0].append(full_folder_path)
+
+
+def get_full_path(folder_name, filename):
+    folder_name = map_legacy(folder_name)
+    if folder_name not in folder_names_and_paths:
+        return None
+    filename = os.path.relpath(os.path.join("/", filename), "/")
+    for folder in folder_names_and_paths[folder_name][0]:
+        full_path = os.path.join(folder, filename)
+        if os.path.isfile(full_path):
+            return full_path
+    return None
+
+
+def get_filename_list(folder_name):
+    output = []
+    for folder in folder_names_and_paths[map_legacy(folder_name)][0]:
+        for root, _, files in os.walk(folder, followlinks=True):
+            output.extend(os.path.relpath(os.path.join(root, f), folder) for f in files)
+    return sorted(output)
+
+
+def get_input_directory():
+    return os.path.join(base_path, "input")
+
+
+def get_output_directory():
+    return os.path.join(base_path, "output")
+
+
+def get_temp_directory():
+    return os.path.join(base_path, "temp")
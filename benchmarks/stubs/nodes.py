@@ -0,0 +1,33 @@
+"""Stand-in for ComfyUI's `nodes`: the core node classes used by the benchmark
+workflows, the loaders of model_loader_info.json, and one node class per
+directory under custom_nodes/."""
+import json
+import os
+
+import folder_paths
+
+PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NODE_CLASS_MAPPINGS = {}
+NODE_DISPLAY_NAME_MAPPINGS = {}
+
+
+def _register(name, relative_python_module="nodes"):
+    NODE_CLASS_MAPPINGS[name] = type(name, (), {"RELATIVE_PYTHON_MODULE": relative_python_module})
+    NODE_DISPLAY_NAME_MAPPINGS[name] = name
+
+
+for name in ["CheckpointLoaderSimple", "CLIPTextEncode", "KSampler", "LoadImage", "VAEEncode", "VAEDecode", "SaveImage", "LoraLoader"]:
+    _register(name)
+
+with open(os.path.join(PLUGIN_ROOT, "model_loader_info.json")) as f:
+    for name in json.load(f):
+        if name not in NODE_CLASS_MAPPINGS:
+            _register(name)
+
+custom_nodes_dir = os.path.join(folder_paths.base_path, "custom_nodes")
+if os.path.isdir(custom_nodes_dir):
+    for repo_name in sorted(os.listdir(custom_nodes_dir)):
+        if os.path.isdir(os.path.join(custom_nodes_dir, repo_name)):
+            # synthetic.py names the node class of every fake repo after the repo
+            _register(repo_name.replace("-", "_") + "_Node", f"custom_nodes.{repo_name}")
@@ -0,0 +1,27 @@
+"""Stand-in for ComfyUI's `server`: a PromptServer with a route table and a
+send_sync that records the events instead of writing to websockets."""
+import threading
+
+from aiohttp import web
+
+
+class PromptServer:
+    instance = None
+
+    def __init__(self):
+        PromptServer.instance = self
+        self.routes = web.RouteTableDef()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def send_sync(self, event, data, sid=None):
+        with self._lock:
+            self.events.append((event, data, sid))
+
+    def make_app(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.add_routes(self.routes)
+        return app
+
+
+PromptServer()
@@ -0,0 +1,149 @@
+"""
+Synthetic ComfyUI trees for the export benchmark: a models directory with
+sparse checkpoints (large on paper, cheap on disk), filler directories for
+the file index to walk, fake custom-node git repos, input files, and
+workflow_api prompts modelled on web/shellagent_default.json.
+"""
+import hashlib
+import json
+import os
+import struct
+
+MB = 1024 ** 2
+
+
+def write_sparse_safetensors(path, size, metadata):
+    """A safetensors file of `size` bytes; only the header is actually written."""
+    header = {"__metadata__": {k: str(v) for k, v in metadata.items()}}
+    header_len = len(json.dumps(header)) + 256
+    num_params = max(0, (size - 8 - header_len) // 2)
+    header["model.diffusion_model.weight"] = {"dtype": "F16", "shape": [num_params], "data_offsets": [0, num_params * 2]}
+    data = json.dumps(header).encode().ljust(header_len, b" ")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(data)))
+        f.write(data)
+        f.truncate(max(size, 8 + len(data)))
+
+
+def write_random_file(path, size, seed):
+    # deterministic content, so repeated runs upload identical files
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    block = hashlib.sha256(seed.encode()).digest() * (64 * 1024 // 32)
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            n = min(len(block), size - written)
+            f.write(block[:n])
+            written += n
+
+
+def make_git_repo(path, name):
+    """A hand-written .git dir: HEAD -> refs/heads/main, with an origin remote."""
+    git_dir = os.path.join(path, ".git")
+    os.makedirs(os.path.join(git_dir, "refs", "heads"), exist_ok=True)
+    with open(os.path.join(git_dir, "HEAD"), "w") as f:
+        f.write("ref: refs/heads/main\n")
+    with open(os.path.join(git_dir, "refs", "heads", "main"), "w") as f:
+        f.write(hashlib.sha1(name.encode()).hexdigest() + "\n")
+    with open(os.path.join(git_dir, "config"), "w") as f:
+        f.write(
+            "[core]\n\trepositoryformatversion = 0\n"
+            f'[remote "origin"]\n\turl = https://github.com/shellagent-bench/{name}.git\n'
+            "\tfetch = +refs/heads/*:refs/remotes/origin/*\n"
+        )
+
+
+def make_comfy_tree(root, checkpoints=4, checkpoint_mb=2048, loras=8, lora_mb=128, custom_nodes=4,
+                    custom_node_model_mb=16, inputs=4, input_kb=512, filler_dirs=50, filler_files=20):
+    """Populate `root` like a ComfyUI install and return the names the workflows refer to."""
+    models_dir = os.path.join(root, "models")
+    make_git_repo(root, "ComfyUI")
+
+    tree = {"root": root, "checkpoints": [], "loras": [], "custom_nodes": [], "inputs": []}
+    for i in range(checkpoints):
+        name = f"bench-ckpt-{i:03d}.safetensors"
+        write_sparse_safetensors(
+            os.path.join(models_dir, "checkpoints", name), checkpoint_mb * MB,
+            {"modelspec.architecture": "stable-diffusion-v1", "bench_id": f"ckpt-{i}"},
+        )
+        tree["checkpoints"].append(name)
+    for i in range(loras):
+        # loras live in sub folders, as they usually do
+        name = f"style-{i % 4}/bench-lora-{i:03d}.safetensors"
+        write_sparse_safetensors(
+            os.path.join(models_dir, "loras", name), lora_mb * MB,
+            {"ss_network_module": "networks.lora", "ss_base_model_version": "sd_v1", "bench_id": f"lora-{i}"},
+        )
+        tree["loras"].append(name)
+
+    # directories the file index has to walk but no workflow refers to
+    for d in range(filler_dirs):
+        for j in range(filler_files):
+            path = os.path.join(models_dir, "embeddings", f"group-{d:03d}", f"embedding-{j:03d}.pt")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"\0" * 64)
+    for folder in ["vae", "clip", "unet", "controlnet", "upscale_models", "configs"]:
+        os.makedirs(os.path.join(models_dir, folder), exist_ok=True)
+
+    for k in range(custom_nodes):
+        repo_name = f"ComfyUI-Bench-Node-{k:02d}"
+        repo_path = os.path.join(root, "custom_nodes", repo_name)
+        os.makedirs(repo_path, exist_ok=True)
+        make_git_repo(repo_path, repo_name)
+        with open(os.path.join(repo_path, "__init__.py"), "w") as f:
+            f.write("NODE_CLASS_MAPPINGS = {}\n")
+        with open(os.path.join(repo_path, "requirements.txt"), "w") as f:
+            f.write("# synthetic requirements\nrequests>=2.0\naiohttp\nnumpy\n")
+        # a model shipped inside the custom node, found through the unknown-model search
+        model_name = f"bench-node-model-{k:02d}.pth"
+        write_random_file(os.path.join(repo_path, "models", model_name), custom_node_model_mb * MB, repo_name)
+        tree["custom_nodes"].append({"repo": repo_name, "class_type": repo_name.replace("-", "_") + "_Node", "model": model_name})
+
+    for i in range(inputs):
+        name = f"bench-input-{i:03d}.png"
+        write_random_file(os.path.join(root, "input", name), input_kb * 1024, name)
+        tree["inputs"].append(name)
+    os.makedirs(os.path.join(root, "output"), exist_ok=True)
+    return tree
+
+
+def make_workflow(tree, copies=1, loras_per_copy=2):
+    """workflow_api prompt: `copies` img2img pipelines like web/shellagent_default.json,
+    each with a lora chain and a custom node, cycling through the tree's files."""
+    prompt = {}
+    for c in range(copies):
+        def nid(n):
+            return str(c * 100 + n)
+
+        prompt[nid(14)] = {"class_type": "CheckpointLoaderSimple", "inputs": {
+            "ckpt_name": tree["checkpoints"][c % len(tree["checkpoints"])]}}
+        model, clip = [nid(14), 0], [nid(14), 1]
+        for j in range(loras_per_copy if tree["loras"] else 0):
+            lora_id = nid(20 + j)
+            prompt[lora_id] = {"class_type": "LoraLoader", "inputs": {
+                "model": model, "clip": clip,
+                "lora_name": tree["loras"][(c * loras_per_copy + j) % len(tree["loras"])],
+                "strength_model": 1.0, "strength_clip": 1.0}}
+            model, clip = [lora_id, 0], [lora_id, 1]
+        prompt[nid(6)] = {"class_type": "CLIPTextEncode", "inputs": {
+            "text": "photograph of victorian woman with wings, sky clouds, meadow grass\n", "clip": clip}}
+        prompt[nid(7)] = {"class_type": "CLIPTextEncode", "inputs": {"text": "watermark, text\n", "clip": clip}}
+        prompt[nid(10)] = {"class_type": "LoadImage", "inputs": {
+            "image": tree["inputs"][c % len(tree["inputs"])], "upload": "image"}}
+        prompt[nid(12)] = {"class_type": "VAEEncode", "inputs": {"pixels": [nid(10), 0], "vae": [nid(14), 2]}}
+        prompt[nid(3)] = {"class_type": "KSampler", "inputs": {
+            "seed": 280823642470253 + c, "steps": 20, "cfg": 8, "sampler_name": "dpmpp_2m",
+            "scheduler": "normal", "denoise": 0.87, "model": model,
+            "positive": [nid(6), 0], "negative": [nid(7), 0], "latent_image": [nid(12), 0]}}
+        prompt[nid(8)] = {"class_type": "VAEDecode", "inputs": {"samples": [nid(3), 0], "vae": [nid(14), 2]}}
+        if tree["custom_nodes"]:
+            custom_node = tree["custom_nodes"][c % len(tree["custom_nodes"])]
+            prompt[nid(30)] = {"class_type": custom_node["class_type"], "inputs": {
+                "images": [nid(8), 0], "model_name": custom_node["model"], "strength": 0.5}}
+            images = [nid(30), 0]
+        else:
+            images = [nid(8), 0]
+        prompt[nid(9)] = {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI", "images": images}}
+    return prompt
@@ -8,8 +8,8 @@ import os
 import uuid
 import tqdm
 import torchaudio
-import hashlib
 from comfy_extras.nodes_audio import SaveAudio
+from shellagent_hashing import get_hash_engine
 
 
 class LoadAudio:
@@ -34,10 +34,7 @@ class LoadAudio:
     @classmethod
     def IS_CHANGED(s, audio):
         image_path = folder_paths.get_annotated_filepath(audio)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return get_hash_engine().hash_file(image_path, "sha256")
 
     @classmethod
     def VALIDATE_INPUTS(s, audio):
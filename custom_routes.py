@@ -24,6 +24,7 @@ from typing import Dict, List, Union, Any, Optional
 from PIL import Image
 import copy
 import struct
+from functools import partial
 from aiohttp import web, ClientSession, ClientError, ClientTimeout, ClientResponseError
 import atexit
 from datetime import datetime
@@ -33,7 +34,8 @@ import re
 import keyword
 import uuid
 
-from .dependency_checker import resolve_dependencies, inspect_repo_version
+from .dependency_checker import resolve_dependencies, inspect_repo_version, estimate_export_cost
+from .export_jobs import export_job_manager, ExportCancelled
 from folder_paths import base_path as BASE_PATH
 
 WORKFLOW_ROOT = "shellagent/comfy_workflow"
@@ -134,30 +136,20 @@ async def shellagent_get_file(request):
     data = json.load(open(os.path.join(WORKFLOW_ROOT, data["workflow_id"], data["filename"])))
     return web.json_response(data, status=400)
     
-@server.PromptServer.instance.routes.post("/shellagent/export") # data same as queue prompt, plus workflow_name
-async def shellagent_export(request):
-    data = await request.json()
-    prompt = data["prompt"]
-    custom_dependencies = data.get("custom_dependencies",  {
-        "models": {},
-        "custom_nodes": {}
-    })
-    # extra_data = data["extra_data"]
-    workflow_id = str(uuid.uuid4())
-    
-    # metadata.json
-    # metadata = {
-    #     "name": data["workflow_name"],
-    #     "workflow_id": workflow_id,
-    #     "create_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    # }
+def export_workflow(prompt, custom_dependencies, job=None, dry_run=False):
+    progress_callback = job.report if job is not None else None
     
     return_dict = {}
     status = 200
     try:
+        if dry_run:
+            # cost preview: nothing is hashed or uploaded
+            return {"success": True, "dry_run": True, "cost": estimate_export_cost(prompt)}, status
+        if job is not None:
+            job.report("schema")
         schemas = schema_validator(prompt)
         # custom_node.json
-        dependency_results = resolve_dependencies(prompt, custom_dependencies)
+        dependency_results = resolve_dependencies(prompt, custom_dependencies, progress_callback=progress_callback)
         # save_root = os.path.join(WORKFLOW_ROOT, workflow_id)
         # os.makedirs(save_root, exist_ok=True)
         
@@ -187,6 +179,8 @@ async def shellagent_export(request):
             "warning_message": warning_message,
             "schemas": schemas
         }
+    except ExportCancelled:
+        raise
     except Exception as e:
         status = 400
         return_dict = {
@@ -194,9 +188,57 @@ async def shellagent_export(request):
             "message_detail": str(traceback.format_exc()),
             "message": str(e),
         }
+    return return_dict, status
+
+
+@server.PromptServer.instance.routes.post("/shellagent/export") # data same as queue prompt, plus workflow_name
+async def shellagent_export(request):
+    data = await request.json()
+    prompt = data["prompt"]
+    custom_dependencies = data.get("custom_dependencies",  {
+        "models": {},
+        "custom_nodes": {}
+    })
+    # extra_data = data["extra_data"]
+    workflow_id = str(uuid.uuid4())
+    
+    # metadata.json
+    # metadata = {
+    #     "name": data["workflow_name"],
+    #     "workflow_id": workflow_id,
+    #     "create_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # }
+    
+    # the export runs on a worker thread so that the event loop keeps serving other clients
+    job = export_job_manager.submit(
+        partial(export_workflow, prompt, custom_dependencies, dry_run=data.get("dry_run", False)),
+        client_id=data.get("client_id"),
+        send_event=server.PromptServer.instance.send_sync,
+    )
+    if data.get("async", False):
+        # progress is streamed over the websocket, the result is fetched from /shellagent/export/{job_id}
+        return web.json_response({"success": True, "job_id": job.id}, status=200)
+    return_dict, status = await asyncio.wrap_future(job.future)
     return web.json_response(return_dict, status=status)
 
 
+@server.PromptServer.instance.routes.get("/shellagent/export/{job_id}")
+async def shellagent_export_status(request):
+    job = export_job_manager.get(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"success": False, "message": "export job not found"}, status=404)
+    return web.json_response(job.to_dict(), status=200)
+
+
+@server.PromptServer.instance.routes.post("/shellagent/export/{job_id}/cancel")
+async def shellagent_export_cancel(request):
+    job = export_job_manager.get(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"success": False, "message": "export job not found"}, status=404)
+    job.cancel()
+    return web.json_response(job.to_dict(include_result=False), status=200)
+
+
 @server.PromptServer.instance.routes.post("/shellagent/inspect_version") # data same as queue prompt, plus workflow_name
 async def shellagent_inspect_version(request):
     data = await request.json()
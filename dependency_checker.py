@@ -3,20 +3,31 @@ import subprocess
 import json
 import logging
 from functools import partial
-import re
-import glob
-import sys
-from folder_paths import models_dir as MODELS_DIR
+import threading
+import time
+from collections import OrderedDict
 from folder_paths import base_path as BASE_PATH
 from folder_paths import get_full_path
 
 
-from .utils.utils import compute_sha256, windows_to_linux_path
+from .utils.utils import compute_sha256, get_cache_dir, windows_to_linux_path
 from .utils.pytree import tree_map
-from .file_upload import collect_local_file, process_local_file_path_async
+from .utils.file_index import get_model_index
+from .utils.hash_cache import get_hash_cache
+from .utils.hashing import hash_files_parallel, quick_fingerprint
+from .utils.model_header import read_model_header
+from .utils.model_catalog import load_model_catalog
+from .utils.git_info import read_repo_info
+from .utils.graph_fingerprint import local_digest
+from .utils.stage_graph import StageGraph
+from .utils.loader_dispatch import LoaderDispatchTable
+from .utils.distributions import get_distribution_snapshot, read_requirements
+from .file_upload import (
+    collect_local_file, local_file_candidates, process_local_file_path_async, pending_upload_bytes, LocalFileCollector,
+)
+from .model_searcher import get_model_searcher_client, StreamingSearch
 
 
-model_list_json = json.load(open(os.path.join(os.path.dirname(__file__), "model_info.json")))
 model_loaders_info = json.load(open(os.path.join(os.path.dirname(__file__), "model_loader_info.json")))
 node_deps_info = json.load(open(os.path.join(os.path.dirname(__file__), "node_deps_info.json")))
 node_blacklist = json.load(open(os.path.join(os.path.dirname(__file__), "node_blacklist.json")))
@@ -24,6 +35,45 @@ node_remote_skip_models = json.load(open(os.path.join(os.path.dirname(__file__),
 
 model_suffix = [".ckpt", ".safetensors", ".bin", ".pth", ".pt", ".onnx", ".gguf", ".sft", ".ttf"]
 extra_packages = ["transformers", "timm", "diffusers", "accelerate"]
+# field patterns and suffix checks compiled once instead of per field of every node
+model_loader_dispatch = LoaderDispatchTable(model_loaders_info, model_suffix)
+
+# checkpoint hashing: number of files hashed at once and total read bandwidth cap (0 = unlimited)
+HASH_WORKERS = int(os.environ.get("SHELLAGENT_HASH_WORKERS", 4))
+HASH_MAX_MBPS = float(os.environ.get("SHELLAGENT_HASH_MAX_MBPS", 0))
+# recognise already-hashed checkpoints by size + sampled blocks instead of re-reading them
+USE_QUICK_FINGERPRINT = os.environ.get("SHELLAGENT_QUICK_FINGERPRINT", "1") == "1"
+
+# throughput used to predict the export time of a dry run, in bytes/s (repos/s for git); updated from real exports
+export_throughput = {
+    "hash": float(os.environ.get("SHELLAGENT_ESTIMATED_HASH_MBPS", 400)) * 1024 ** 2,
+    "upload": float(os.environ.get("SHELLAGENT_ESTIMATED_UPLOAD_MBPS", 20)) * 1024 ** 2,
+    "git": float(os.environ.get("SHELLAGENT_ESTIMATED_GIT_PER_SEC", 1000)),
+}
+# smallest sample that updates the estimate of each kind
+THROUGHPUT_MIN_SAMPLE = {"hash": 16 * 1024 ** 2, "upload": 16 * 1024 ** 2, "git": 1}
+
+
+def record_throughput(kind, amount, elapsed):
+    # only transfers large enough to be meaningful update the estimate
+    if amount >= THROUGHPUT_MIN_SAMPLE[kind] and elapsed > 0:
+        export_throughput[kind] = amount / elapsed
+
+
+_model_catalog = None
+_model_catalog_lock = threading.Lock()
+
+
+def get_model_catalog():
+    # model_info.json is compiled into an mmapped binary index on first use instead of being loaded at import
+    global _model_catalog
+    with _model_catalog_lock:
+        if _model_catalog is None:
+            _model_catalog = load_model_catalog(
+                os.path.join(os.path.dirname(__file__), "model_info.json"),
+                os.path.join(get_cache_dir(), "model_info.bin"),
+            )
+        return _model_catalog
 
 
 def get_full_path_or_raise(folder_name: str, filename: str) -> str:
@@ -33,27 +83,73 @@ def get_full_path_or_raise(folder_name: str, filename: str) -> str:
     return full_path
 
 
-def handle_model_info(ckpt_path, filename, rel_save_path):
-    ckpt_path = windows_to_linux_path(ckpt_path)
+def read_sidecar_model_id(ckpt_path):
+    # sidecars written by older versions are only trusted if newer than the checkpoint
     metadata_path = ckpt_path + ".json"
-    if os.path.isfile(metadata_path):
-        metadata = json.load(open(metadata_path))
-        model_id = metadata["id"]
-    else:
-        logging.info(f"computing sha256 of {ckpt_path}")
-        if not os.path.isfile(ckpt_path):
-            raise NotImplementedError(f"please install {ckpt_path} first!")
-        model_id = compute_sha256(ckpt_path)
-        data = {
-            "id": model_id,
-            "save_path": rel_save_path,
-            "filename": filename,
-        }
-        json.dump(data, open(metadata_path, "w"))
-    if model_id in model_list_json:
-        urls = [item["url"] for item in model_list_json[model_id]["links"]][:10] # use the top 10
-    else:
-        urls = []
+    if os.path.isfile(metadata_path) and os.path.getmtime(metadata_path) >= os.path.getmtime(ckpt_path):
+        return json.load(open(metadata_path))["id"]
+    return None
+
+
+def known_model_id(ckpt_path):
+    """The sha256 get_model_id finds without hashing the whole file, or None."""
+    ckpt_path = windows_to_linux_path(ckpt_path)
+    hash_cache = get_hash_cache()
+    model_id = hash_cache.lookup(ckpt_path) or read_sidecar_model_id(ckpt_path)
+    if model_id is None and USE_QUICK_FINGERPRINT:
+        model_id = hash_cache.lookup_fingerprint(quick_fingerprint(ckpt_path))
+    return model_id
+
+
+def get_model_id(ckpt_path, on_chunk=None):
+    ckpt_path = windows_to_linux_path(ckpt_path)
+    if not os.path.isfile(ckpt_path):
+        raise NotImplementedError(f"please install {ckpt_path} first!")
+    hash_cache = get_hash_cache()
+    model_id = hash_cache.lookup(ckpt_path)
+    if model_id is None:
+        model_id = read_sidecar_model_id(ckpt_path)
+        if model_id is not None:
+            hash_cache.store(ckpt_path, model_id)
+        else:
+            logging.info(f"computing sha256 of {ckpt_path}")
+            model_id = hash_cache.get_or_compute(
+                ckpt_path,
+                compute=partial(compute_sha256, on_chunk=on_chunk),
+                use_fingerprint=USE_QUICK_FINGERPRINT,
+            )
+    return model_id
+
+
+def hash_checkpoints(ckpt_paths, progress_callback=None, on_result=None, cancel_event=None):
+    # cache hits are resolved inline, only the misses go through the worker pool
+    model_ids = {}
+    to_hash = []
+    hash_cache = get_hash_cache()
+    for ckpt_path in ckpt_paths:
+        model_id = hash_cache.lookup(windows_to_linux_path(ckpt_path))
+        if model_id is None:
+            to_hash.append(ckpt_path)
+        else:
+            model_ids[ckpt_path] = model_id
+            if on_result is not None:
+                on_result(ckpt_path, model_id)
+    model_ids.update(hash_files_parallel(
+        to_hash,
+        get_model_id,
+        max_workers=HASH_WORKERS,
+        max_bytes_per_sec=HASH_MAX_MBPS * 1024 ** 2,
+        progress_callback=progress_callback,
+        on_result=on_result,
+        cancel_event=cancel_event,
+    ))
+    return model_ids
+
+
+def handle_model_info(ckpt_path, filename, rel_save_path, model_id=None):
+    if model_id is None:
+        model_id = get_model_id(ckpt_path)
+    urls = get_model_catalog().get_urls(model_id) or [] # the top 10
         
     item = {
         "filename": windows_to_linux_path(filename),
@@ -71,9 +167,21 @@ def inspect_repo_version(module_path):
         "commit": ""
     }
     
-    if not os.path.isdir(os.path.join(module_path, ".git")):
+    if not os.path.exists(os.path.join(module_path, ".git")):
+        return result
+    
+    # read HEAD, refs and the remote url directly from the git directory (cached until they change)
+    try:
+        repo_info = read_repo_info(module_path)
+    except Exception:
+        repo_info = None
+    if repo_info is not None and repo_info["commit"] is not None:
+        if repo_info["repo"] is not None: # repos without an origin are reported empty, as with the git cli
+            result["repo"] = repo_info["repo"]
+            result["commit"] = repo_info["commit"]
         return result
     
+    # fall back to the git cli, e.g. for layouts the reader does not understand
     # Get the remote repository URL
     try:
         remote_url = subprocess.check_output(
@@ -100,253 +208,433 @@ def inspect_repo_version(module_path):
     }
     return result
 
-def fetch_model_searcher_results(model_ids):
-    import requests
-    url = "https://models-searcher.myshell.life/search_urls"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    data = {
-        "sha256": model_ids
-    }
-
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        results = [item[:10] for item in response.json()]
-    else:
-        results = None
-    return results
-
-def split_package_version(require_line):
-    require_line = require_line.strip()
-    
-    pattern = r"^([a-zA-Z0-9_\-\[\]]+)(.*)$"
-    match = re.match(pattern, require_line.strip())
-    
-    if match:
-        package_name = match.group(1)  # First capturing group is the package name
-        version_specifier = match.group(2) if match.group(2) else ""  # Second group is the version, if present
-        return package_name, version_specifier
-    else:
-        assert len(require_line) == 0 or require_line.strip()[0] == "#", require_line
-        return None, None
-
-def get_package_version(package_name):
-    try:
-        if sys.version_info >= (3, 8):
-            from importlib.metadata import version, PackageNotFoundError
-            return version(package_name)
-        else:
-            from pkg_resources import get_distribution, DistributionNotFound
-            return get_distribution(package_name).version
-    except Exception:
-        return None
-    
-def resolve_dependencies(prompt, custom_dependencies): # resolve custom nodes and models at the same time
-    from nodes import NODE_CLASS_MAPPINGS
+SKIP_FOLDER_NAMES = ["configs", "custom_nodes"]
+def collect_unknown_models(filename, node_id, node_info, custom_node_path, ckpt_paths, model_index):
     import folder_paths
-    
-    custom_nodes = []
-    ckpt_paths = {}
-    
-    file_mapping_dict = {}
-    
-    SKIP_FOLDER_NAMES = ["configs", "custom_nodes"]
-    def collect_unknown_models(filename, node_id, node_info, custom_node_path):
-        if type(filename) != str:
-            return
-        is_model = False
-        for possible_suffix in model_suffix:
-            if filename.endswith(possible_suffix):
-                is_model = True
-        if is_model:
-            print(f"find {filename}, is_model=True")
-            # find possible paths
-            matching_files = {}
-            # Walk through all subdirectories and files in the directory
-            rel_save_path = None
-            for possible_folder_name in folder_paths.folder_names_and_paths:
-                if possible_folder_name in SKIP_FOLDER_NAMES:
-                    print(f"skip {possible_folder_name}")
-                    continue
-                full_path = folder_paths.get_full_path(possible_folder_name, filename)
-                if full_path is None:
-                    continue
-                rel_save_path = os.path.relpath(folder_paths.folder_names_and_paths[possible_folder_name][0][0], folder_paths.models_dir)
+    if type(filename) != str:
+        return
+    if model_loader_dispatch.is_model_file(filename):
+        print(f"find {filename}, is_model=True")
+        # find possible paths
+        matching_files = {}
+        # Walk through all subdirectories and files in the directory
+        rel_save_path = None
+        for possible_folder_name in folder_paths.folder_names_and_paths:
+            if possible_folder_name in SKIP_FOLDER_NAMES:
+                print(f"skip {possible_folder_name}")
+                continue
+            full_path = folder_paths.get_full_path(possible_folder_name, filename)
+            if full_path is None:
+                continue
+            rel_save_path = os.path.relpath(folder_paths.folder_names_and_paths[possible_folder_name][0][0], folder_paths.models_dir)
+            matching_files[full_path] = {
+                "rel_save_path": rel_save_path
+            }
+
+        print(f"matched files: {matching_files}")
+        
+        # step 2: search for all the files under "models"
+        
+        for full_path in model_index.lookup(filename, folder_paths.models_dir):
+            if full_path not in matching_files:
+                folder_path = full_path[:-len(filename)]
+                rel_save_path = os.path.relpath(folder_path, folder_paths.models_dir)
                 matching_files[full_path] = {
                     "rel_save_path": rel_save_path
                 }
-
-            print(f"matched files: {matching_files}")
-            
-            # step 2: search for all the files under "models"
-            
-            for full_path in glob.glob(f"{folder_paths.models_dir}/**/*", recursive=True):
-                if os.path.isfile(full_path) and full_path.endswith(filename) and full_path not in matching_files:
+                
+        print(f"matched files: {matching_files}")
+        
+        # step 3: search inside the custom nodes
+        if custom_node_path is not None:
+            for full_path in model_index.lookup(filename, custom_node_path):
+                if full_path not in matching_files:
                     folder_path = full_path[:-len(filename)]
                     rel_save_path = os.path.relpath(folder_path, folder_paths.models_dir)
                     matching_files[full_path] = {
                         "rel_save_path": rel_save_path
                     }
-                    
-            print(f"matched files: {matching_files}")
-            
-            # step 3: search inside the custom nodes
-            if custom_node_path is not None:
-                for full_path in glob.glob(f"{custom_node_path}/**/*", recursive=True):
-                    if os.path.isfile(full_path) and full_path.endswith(filename) and full_path not in matching_files:
-                        folder_path = full_path[:-len(filename)]
-                        rel_save_path = os.path.relpath(folder_path, folder_paths.models_dir)
-                        matching_files[full_path] = {
-                            "rel_save_path": rel_save_path
-                        }
-            
-            if len(matching_files) == 0:
-                raise ValueError(f"Cannot find model: `{filename}`, Node ID: `{node_id}`, Node Info: `{node_info}`")
+        
+        if len(matching_files) == 0:
+            raise ValueError(f"Cannot find model: `{filename}`, Node ID: `{node_id}`, Node Info: `{node_info}`")
+        
+        elif len(matching_files) <= 3:
+            for full_path, info in matching_files.items():
+                ckpt_paths[full_path] = {
+                    "filename": filename,
+                    "rel_save_path": info["rel_save_path"]
+                }
+                return
+        else:
+            raise ValueError(f"Multiple models of `{filename}` founded, Node ID: `{node_id}`, Node Info: `{node_info}`, Possible paths: `{list(matching_files.keys())}`")
+
+
+def resolve_node(node_id, node_info, model_index, node_class_mappings, local_files=None):
+    # everything a single node contributes to the dependencies
+    import folder_paths
+    
+    node_class_type = node_info.get("class_type")
+    if node_class_type is None:
+        raise NotImplementedError("Missing nodes founded, please first install the missing nodes using ComfyUI Manager")
+    node_cls = node_class_mappings[node_class_type]
+    
+    contribution = {
+        "custom_node": None,
+        "ckpt_paths": {},
+        "files": {},
+    }
+    ckpt_paths = contribution["ckpt_paths"]
+    
+    skip_model_check = False
+    
+    custom_node_path = None
+    if hasattr(node_cls, "RELATIVE_PYTHON_MODULE") and node_cls.RELATIVE_PYTHON_MODULE.startswith("custom_nodes."):
+        print(node_cls.RELATIVE_PYTHON_MODULE)
+        contribution["custom_node"] = node_cls.RELATIVE_PYTHON_MODULE
+        custom_node_path = os.path.join(BASE_PATH, node_cls.RELATIVE_PYTHON_MODULE.replace(".", "/"))
+        if node_cls.RELATIVE_PYTHON_MODULE[len("custom_nodes."):] in node_remote_skip_models:
+            skip_model_check = True
+            print(f"skip model check for {node_class_type}")
             
-            elif len(matching_files) <= 3:
-                for full_path, info in matching_files.items():
-                    ckpt_paths[full_path] = {
-                        "filename": filename,
-                        "rel_save_path": info["rel_save_path"]
-                    }
-                    return
+    if node_class_type in model_loader_dispatch:
+        for field_name, filename, save_path in model_loader_dispatch.model_inputs(node_class_type, node_info["inputs"]):
+            ckpt_path = get_full_path_or_raise(save_path, filename)
+            if hasattr(folder_paths, "map_legacy"):
+                save_folder = folder_paths.map_legacy(save_path)
             else:
-                raise ValueError(f"Multiple models of `{filename}` founded, Node ID: `{node_id}`, Node Info: `{node_info}`, Possible paths: `{list(matching_files.keys())}`")
-            
+                save_folder = save_path
+            rel_save_path = os.path.relpath(folder_paths.folder_names_and_paths[save_folder][0][0], folder_paths.models_dir)
+            ckpt_paths[ckpt_path] = {
+                "filename": filename,
+                "rel_save_path": rel_save_path
+            }
+    elif not skip_model_check:
+        tree_map(lambda x: collect_unknown_models(x, node_id, node_info, custom_node_path, ckpt_paths, model_index), node_info["inputs"])
+
+    list(map(partial(collect_local_file, mapping_dict=contribution["files"], collector=local_files), node_info["inputs"].values()))
+    return contribution
+
+
+NODE_CACHE_SIZE = 4096
+_node_cache = OrderedDict() # fingerprint -> (contribution, stats of the referenced files)
+_node_cache_lock = threading.Lock()
+
+
+def _file_stats(paths):
+    stats = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stats.append((path, st.st_size, st.st_mtime_ns))
+        except OSError:
+            stats.append((path, None, None))
+    return stats
+
+
+def resolve_node_cached(node_id, node_info, model_index, generation, node_class_mappings, local_files=None):
+    """resolve_node, memoized on (class_type, inputs, model/input folder state) and the stats of the files it referenced"""
+    fingerprint = (local_digest(node_info), generation)
+    with _node_cache_lock:
+        cached = _node_cache.get(fingerprint)
+        if cached is not None:
+            _node_cache.move_to_end(fingerprint)
+    if cached is not None:
+        contribution, stats = cached
+        if _file_stats([path for path, _, _ in stats]) == stats:
+            return contribution
+    
+    contribution = resolve_node(node_id, node_info, model_index, node_class_mappings, local_files)
+    # media inputs that did not resolve are kept as (path, None, None): creating the file invalidates the entry
+    input_dir = local_files.input_dir if local_files is not None else None
+    candidates = [path for item in node_info["inputs"].values() for path in local_file_candidates(item, input_dir)]
+    stats = _file_stats(list(dict.fromkeys(
+        list(contribution["ckpt_paths"]) + [file_info[0] for file_info in contribution["files"].values()] + candidates
+    )))
+    with _node_cache_lock:
+        _node_cache[fingerprint] = (contribution, stats)
+        while len(_node_cache) > NODE_CACHE_SIZE:
+            _node_cache.popitem(last=False)
+    return contribution
+
+
+def log_hash_progress(event):
+    if event["status"] == "done":
+        logging.info(f"[{event['index'] + 1}/{event['total']}] hashed {event['path']}, time elapsed: {event['elapsed']:.1f}s")
+    elif event["status"] == "hashing" and event["bytes_total"]:
+        logging.info(f"[{event['index'] + 1}/{event['total']}] hashing {event['path']}: {100 * event['bytes_done'] / event['bytes_total']:.0f}%")
+
+
+def collect_prompt_dependencies(prompt):
+    # walk the prompt: custom nodes, checkpoints and local files referenced by the nodes
+    from nodes import NODE_CLASS_MAPPINGS
+    import folder_paths
     
+    custom_nodes = []
+    ckpt_paths = {}
+    file_mapping_dict = {}
+
+    # re-validate the persistent file index once per export (one stat per directory)
+    model_index = get_model_index()
+    model_index.mark_stale()
+
+    # only nodes whose inputs or referenced files changed since the last export are resolved again
+    model_index.refresh(folder_paths.models_dir)
+    try:
+        input_dir_mtime = os.stat(folder_paths.get_input_directory()).st_mtime_ns
+    except OSError:
+        input_dir_mtime = None
+    generation = (model_index.generation(folder_paths.models_dir), input_dir_mtime)
+    # stat results and input dir listings shared by all the nodes of this export
+    local_files = LocalFileCollector()
     for node_id, node_info in prompt.items():
-        node_class_type = node_info.get("class_type")
-        if node_class_type is None:
-            raise NotImplementedError(f"Missing nodes founded, please first install the missing nodes using ComfyUI Manager")
-        node_cls = NODE_CLASS_MAPPINGS[node_class_type]
-        
-        skip_model_check = False
-        
-        custom_node_path = None
-        if hasattr(node_cls, "RELATIVE_PYTHON_MODULE") and node_cls.RELATIVE_PYTHON_MODULE.startswith("custom_nodes."):
-            print(node_cls.RELATIVE_PYTHON_MODULE)
-            custom_nodes.append(node_cls.RELATIVE_PYTHON_MODULE)
-            custom_node_path = os.path.join(BASE_PATH, node_cls.RELATIVE_PYTHON_MODULE.replace(".", "/"))
-            if node_cls.RELATIVE_PYTHON_MODULE[len("custom_nodes."):] in node_remote_skip_models:
-                skip_model_check = True
-                print(f"skip model check for {node_class_type}")
-                
-        if node_class_type in model_loaders_info:
-            for field_name, filename in node_info["inputs"].items():
-                if type(filename) != str:
-                    continue
-                for item in model_loaders_info[node_class_type]:
-                    pattern = item["field_name"]
-                    if re.match(f"^{pattern}$", field_name) and any([filename.endswith(possible_suffix) for possible_suffix in model_suffix]):
-                        ckpt_path = get_full_path_or_raise(item["save_path"], filename)
-                        if hasattr(folder_paths, "map_legacy"):
-                            save_folder = folder_paths.map_legacy(item["save_path"])
-                        else:
-                            save_folder = item["save_path"]
-                        rel_save_path = os.path.relpath(folder_paths.folder_names_and_paths[save_folder][0][0], folder_paths.models_dir)
-                        ckpt_paths[ckpt_path] = {
-                            "filename": filename,
-                            "rel_save_path": rel_save_path
-                        }
-        elif not skip_model_check:
-            tree_map(lambda x: collect_unknown_models(x, node_id, node_info, custom_node_path), node_info["inputs"])
-
-        list(map(partial(collect_local_file, mapping_dict=file_mapping_dict), node_info["inputs"].values()))
-            
+        contribution = resolve_node_cached(node_id, node_info, model_index, generation, NODE_CLASS_MAPPINGS, local_files)
+        if contribution["custom_node"] is not None:
+            custom_nodes.append(contribution["custom_node"])
+        for ckpt_path, ckpt_info in contribution["ckpt_paths"].items():
+            ckpt_paths[ckpt_path] = dict(ckpt_info)
+        for item, file_info in contribution["files"].items():
+            file_mapping_dict.setdefault(item, file_info)
+
+    model_index.save()
     print("ckpt_paths:", ckpt_paths)
-    custom_nodes = list(set(custom_nodes))
-    # step 0: comfyui version
-    repo_info = inspect_repo_version(BASE_PATH)
+    return {
+        "custom_nodes": list(set(custom_nodes)),
+        "ckpt_paths": ckpt_paths,
+        "file_mapping_dict": file_mapping_dict,
+    }
+
+
+def fill_custom_repo_info(repo_info, custom_dependencies):
     if repo_info["repo"] == "":
         repo_info["require_recheck"] = True
         if repo_info["name"] in custom_dependencies["custom_nodes"]:
             repo_info["repo"] = custom_dependencies["custom_nodes"][repo_info["name"]].get("repo", "")
             repo_info["commit"] = custom_dependencies["custom_nodes"][repo_info["name"]].get("commit", "")
-    comfyui_version = repo_info
+    return repo_info
+
+
+def resolve_dependencies(prompt, custom_dependencies, progress_callback=None): # resolve custom nodes and models at the same time
+    # progress_callback(phase, **info) is also where export jobs get cancelled (it raises)
+    stages = StageGraph()
+    
+    def report(phase, **info):
+        # stops a stage once another one failed
+        stages.check_cancelled()
+        if progress_callback is not None:
+            progress_callback(phase, **info)
+    
+    def on_hash_progress(event):
+        log_hash_progress(event)
+        report("models", file=event)
+    
+    # the export runs as a graph of stages, each one starts as soon as its inputs are ready:
+    #   collect ──┬── custom_nodes ── pypi
+    #             ├── models (model searcher lookups start as each hash completes)
+    #             └── files
+    #   comfyui_version
+    def collect_stage():
+        report("collect", nodes=len(prompt))
+        return collect_prompt_dependencies(prompt)
+    
+    # step 0: comfyui version
+    def comfyui_version_stage():
+        report("comfyui_version")
+        return fill_custom_repo_info(inspect_repo_version(BASE_PATH), custom_dependencies)
 
     # step 1: custom nodes
-    custom_nodes_list = []
-    custom_nodes_names = []
-    requirements_lines = []
-    for custom_node in custom_nodes:
-        try:
-            repo_info = inspect_repo_version(os.path.join(BASE_PATH, custom_node.replace(".", "/")))
-            custom_nodes_list.append(repo_info)
-            if repo_info["repo"] == "":
-                repo_info["require_recheck"] = True
-                if repo_info["name"] in custom_dependencies["custom_nodes"]:
-                    repo_info["repo"] = custom_dependencies["custom_nodes"][repo_info["name"]].get("repo", "")
-                    repo_info["commit"] = custom_dependencies["custom_nodes"][repo_info["name"]].get("commit", "")
-            custom_nodes_names.append(repo_info["name"])
-        except:
-            print(f"failed to resolve repo info of {custom_node}")
-        requirement_file = os.path.join(BASE_PATH, custom_node.replace(".", "/"), "requirements.txt")
-        if os.path.isfile(requirement_file):
+    def custom_nodes_stage(collect):
+        custom_nodes = collect["custom_nodes"]
+        report("custom_nodes", total=len(custom_nodes))
+        inspection_seconds = []
+        
+        def inspect(module_path):
+            start = time.time()
+            try:
+                return inspect_repo_version(module_path)
+            finally:
+                inspection_seconds.append(time.time() - start)
+        
+        custom_nodes_list = []
+        custom_nodes_names = []
+        requirements = []
+        for custom_node in custom_nodes:
             try:
-                requirements_lines += open(requirement_file).readlines()
+                repo_info = inspect(os.path.join(BASE_PATH, custom_node.replace(".", "/")))
+                custom_nodes_list.append(repo_info)
+                fill_custom_repo_info(repo_info, custom_dependencies)
+                custom_nodes_names.append(repo_info["name"])
             except:
-                pass
-    requirements_lines = list(set(requirements_lines))
-    requirements_packages = [package_name for package_name, version_specifier in map(split_package_version, requirements_lines) if package_name is not None]
-    package_names = set(requirements_packages + extra_packages)
-    pypi_deps = {
-        package_name: get_package_version(package_name)
-        for package_name in package_names
-    }
+                print(f"failed to resolve repo info of {custom_node}")
+            requirement_file = os.path.join(BASE_PATH, custom_node.replace(".", "/"), "requirements.txt")
+            if os.path.isfile(requirement_file):
+                requirements += read_requirements(requirement_file)
+        
+        for repo_name in custom_nodes_names:
+            if repo_name in node_deps_info:
+                for deps_node in node_deps_info[repo_name]:
+                    if deps_node["name"] not in custom_nodes_names:
+                        repo_info = inspect(os.path.join(BASE_PATH, "custom_nodes", deps_node["name"]))
+                        deps_node["commit"] = repo_info["commit"]
+                        custom_nodes_list.append(deps_node)
+                        custom_nodes_names.append(deps_node["name"])
+                        
+        record_throughput("git", len(inspection_seconds), sum(inspection_seconds))
+        
+        black_list_nodes = []
+        for repo_name in custom_nodes_names:
+            if repo_name in node_blacklist:
+                black_list_nodes.append({"name": repo_name, "reason": node_blacklist[repo_name]["reason"]})
+        return {
+            "custom_nodes_list": custom_nodes_list,
+            "black_list_nodes": black_list_nodes,
+            "requirements": requirements,
+        }
     
-    for repo_name in custom_nodes_names:
-        if repo_name in node_deps_info:
-            for deps_node in node_deps_info[repo_name]:
-                if deps_node["name"] not in custom_nodes_names:
-                    repo_info = inspect_repo_version(os.path.join(BASE_PATH, "custom_nodes", deps_node["name"]))
-                    deps_node["commit"] = repo_info["commit"]
-                    custom_nodes_list.append(deps_node)
-                    custom_nodes_names.append(deps_node["name"])
-                    
-    black_list_nodes = []
-    for repo_name in custom_nodes_names:
-        if repo_name in node_blacklist:
-            black_list_nodes.append({"name": repo_name, "reason": node_blacklist[repo_name]["reason"]})
+    def pypi_stage(custom_nodes):
+        requirements_packages = [package_name for package_name, version_specifier in custom_nodes["requirements"] if package_name is not None]
+        package_names = set(requirements_packages + extra_packages)
+        report("pypi", total=len(package_names))
+        # one snapshot of the installed distributions, then a dict lookup per package
+        snapshot = get_distribution_snapshot()
+        versions = snapshot.versions()
+        return {
+            package_name: snapshot.version(package_name, versions)
+            for package_name in package_names
+        }
     
     # step 2: models
-    models_dict = {}
-    missing_model_ids = []
-    for ckpt_path, ckpt_info in ckpt_paths.items():
-        model_id, item = handle_model_info(ckpt_path, ckpt_info["filename"], ckpt_info["rel_save_path"])
-        models_dict[model_id] = item
-        if len(item["urls"]) == 0:
-            item["require_recheck"] = True
-            if model_id in custom_dependencies["models"]:
-                item["urls"] = custom_dependencies["models"][model_id].get("urls", [])
-            missing_model_ids.append(model_id)
-            
-    # try to fetch from myshell model searcher
-    missing_model_results_myshell = fetch_model_searcher_results(missing_model_ids)
-    if missing_model_results_myshell is not None:
-        for missing_model_id, missing_model_urls in zip(missing_model_ids, missing_model_results_myshell):
+    def models_stage(collect):
+        ckpt_paths = collect["ckpt_paths"]
+        report("models", total=len(ckpt_paths))
+        models_dict = {}
+        missing_model_ids = []
+        # try to fetch from myshell model searcher, while the remaining checkpoints are still being hashed
+        searcher = StreamingSearch(get_model_searcher_client())
+        
+        def on_hashed(ckpt_path, model_id):
+            ckpt_info = ckpt_paths[ckpt_path]
+            model_id, item = handle_model_info(ckpt_path, ckpt_info["filename"], ckpt_info["rel_save_path"], model_id=model_id)
+            header = read_model_header(ckpt_path)
+            if header is not None:
+                item["header"] = header
+            models_dict[model_id] = item
+            if len(item["urls"]) == 0:
+                item["require_recheck"] = True
+                if model_id in custom_dependencies["models"]:
+                    item["urls"] = custom_dependencies["models"][model_id].get("urls", [])
+                missing_model_ids.append(model_id)
+                searcher.submit(model_id)
+        
+        # bytes actually read by the hash workers: sidecar and fingerprint hits read none
+        hashed_bytes = []
+        
+        def on_progress(event):
+            if event["status"] == "done":
+                hashed_bytes.append(event["bytes_done"])
+            on_hash_progress(event)
+        
+        hash_start = time.time()
+        try:
+            hash_checkpoints(list(ckpt_paths), progress_callback=on_progress, on_result=on_hashed,
+                             cancel_event=stages.cancel_event)
+        except BaseException:
+            searcher.close(timeout=0)
+            raise
+        searcher_results = searcher.close()
+        record_throughput("hash", sum(hashed_bytes), time.time() - hash_start)
+        report("model_searcher", total=len(missing_model_ids))
+        for missing_model_id in missing_model_ids:
+            missing_model_urls = searcher_results.get(missing_model_id, [])
             if len(missing_model_urls) > 0:
                 models_dict[missing_model_id]["require_recheck"] = False
                 models_dict[missing_model_id]["urls"] = missing_model_urls
                 print("successfully fetch results from myshell", models_dict[missing_model_id])
+        return models_dict
 
     # step 3: handle local files
-    process_local_file_path_async(file_mapping_dict, max_workers=20)
-    files_dict = {
-        v[0]: {
-            "filename": windows_to_linux_path(os.path.relpath(v[2], BASE_PATH)) if not v[3] else v[2], 
-            "urls": [v[1]]} for v in file_mapping_dict.values()}
+    def files_stage(collect):
+        file_mapping_dict = collect["file_mapping_dict"]
+        report("files", total=len(file_mapping_dict))
+        upload_start = time.time()
+        upload_bytes = pending_upload_bytes(file_mapping_dict)
+        process_local_file_path_async(
+            file_mapping_dict,
+            progress_callback=lambda done, total: report("files", done=done, total=total),
+            cancel_event=stages.cancel_event,
+        )
+        record_throughput("upload", upload_bytes, time.time() - upload_start)
+        return {
+            v[0]: {
+                "filename": windows_to_linux_path(os.path.relpath(v[2], BASE_PATH)) if not v[3] else v[2], 
+                "urls": [v[1]]} for v in file_mapping_dict.values()}
+    
+    stages.add("collect", collect_stage)
+    stages.add("comfyui_version", comfyui_version_stage)
+    stages.add("custom_nodes", custom_nodes_stage, deps=["collect"])
+    stages.add("pypi", pypi_stage, deps=["custom_nodes"])
+    stages.add("models", models_stage, deps=["collect"])
+    stages.add("files", files_stage, deps=["collect"])
+    results = stages.run()
     
     depencencies = {
-        "comfyui_version": comfyui_version,
-        "custom_nodes": custom_nodes_list,
-        "models": models_dict,
-        "files": files_dict,
-        "pypi": pypi_deps
+        "comfyui_version": results["comfyui_version"],
+        "custom_nodes": results["custom_nodes"]["custom_nodes_list"],
+        "models": results["models"],
+        "files": results["files"],
+        "pypi": results["pypi"]
     }
     
     return_dict = {
         "dependencies": depencencies,
-        "black_list_nodes": black_list_nodes,
+        "black_list_nodes": results["custom_nodes"]["black_list_nodes"],
+        "stage_timings": stages.timings,
     }
     return return_dict
+
+
+def count_git_inspections(custom_nodes):
+    """Repos an export inspects: ComfyUI, the custom nodes and the extra repos they need (node_deps_info)."""
+    names = [os.path.basename(custom_node.replace(".", "/")) for custom_node in custom_nodes]
+    for repo_name in names:  # grows while iterating, dependencies of dependencies are inspected too
+        for deps_node in node_deps_info.get(repo_name, []):
+            if deps_node["name"] not in names:
+                names.append(deps_node["name"])
+    return 1 + len(names)
+
+
+def estimate_export_cost(prompt):
+    """Dry run of resolve_dependencies: walks the same paths, but hashes and uploads nothing."""
+    start = time.time()
+    collect = collect_prompt_dependencies(prompt)
+    collect_seconds = time.time() - start
+    
+    hash_bytes = 0
+    hash_misses = []
+    for ckpt_path in collect["ckpt_paths"]:
+        # sidecar and fingerprint hits are resolved without reading the checkpoint
+        if known_model_id(ckpt_path) is None:
+            hash_misses.append(ckpt_path)
+            hash_bytes += os.path.getsize(ckpt_path)
+    
+    upload_bytes = pending_upload_bytes(collect["file_mapping_dict"])
+    git_inspections = count_git_inspections(collect["custom_nodes"])
+    
+    hash_seconds = hash_bytes / export_throughput["hash"]
+    upload_seconds = upload_bytes / export_throughput["upload"]
+    git_seconds = git_inspections / export_throughput["git"]
+    return {
+        "models": len(collect["ckpt_paths"]),
+        "hash_cache_misses": hash_misses,
+        "hash_bytes": hash_bytes,
+        "files": len(collect["file_mapping_dict"]),
+        "upload_bytes": upload_bytes,
+        "git_inspections": git_inspections,
+        # hashing and uploads run concurrently after the graph walk, so the slowest of them is the critical path
+        "predicted_seconds": collect_seconds + max(hash_seconds, upload_seconds, git_seconds),
+        "predicted_phase_seconds": {
+            "collect": collect_seconds,
+            "models": hash_seconds,
+            "files": upload_seconds,
+            "custom_nodes": git_seconds,
+        },
+    }
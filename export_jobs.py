@@ -0,0 +1,131 @@
+"""
+Export jobs: `/shellagent/export` work (hashing, uploads, git inspection)
+runs on a worker thread instead of the aiohttp event loop. Progress is
+pushed over the ComfyUI websocket as "shellagent.export.progress" events.
+"""
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_TTL = 3600  # finished jobs are kept this long for clients to fetch the result
+PROGRESS_EVENT = "shellagent.export.progress"
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportJob:
+    def __init__(self, client_id=None, send_event=None):
+        self.id = str(uuid.uuid4())
+        self.client_id = client_id
+        self.send_event = send_event
+        self.status = "pending"
+        self.phase = None
+        self.progress = {}
+        self.result = None
+        self.http_status = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ("success", "failed", "cancelled")
+
+    def cancel(self):
+        if not self.done:
+            self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise ExportCancelled(f"export job {self.id} was cancelled")
+
+    def report(self, phase, **info):
+        # called from the worker thread between (and during) phases
+        self.check_cancelled()
+        self.phase = phase
+        self.progress = info
+        self._send({"phase": phase, **info})
+
+    def _send(self, data):
+        if self.send_event is None:
+            return
+        try:
+            self.send_event(PROGRESS_EVENT, {"job_id": self.id, "status": self.status, **data}, self.client_id)
+        except Exception as e:
+            logging.warning(f"failed to send export progress: {e}")
+
+    def to_dict(self, include_result=True):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if include_result and self.done:
+            data["result"] = self.result
+        return data
+
+
+class ExportJobManager:
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shellagent-export")
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            for job_id in [
+                job_id for job_id, job in self.jobs.items()
+                if job.done and job.finished_at is not None and now - job.finished_at > JOB_TTL
+            ]:
+                del self.jobs[job_id]
+
+    def submit(self, fn, client_id=None, send_event=None):
+        """Run `fn(job)` on a worker thread; it returns the (result, http status) of the export."""
+        self._prune()
+        job = ExportJob(client_id=client_id, send_event=send_event)
+        with self._lock:
+            self.jobs[job.id] = job
+
+        def run():
+            job.status = "running"
+            try:
+                job.check_cancelled()
+                result, http_status = fn(job)
+                status = "success" if result.get("success") else "failed"
+            except ExportCancelled as e:
+                status = "cancelled"
+                result, http_status = {"success": False, "message": str(e)}, 400
+            except Exception as e:
+                status = "failed"
+                result, http_status = {
+                    "success": False,
+                    "message_detail": str(traceback.format_exc()),
+                    "message": str(e),
+                }, 400
+            # the status goes last: a job seen as done always has its result and finished_at
+            with self._lock:
+                job.finished_at = time.time()
+                job.result, job.http_status = result, http_status
+                job.status = status
+            job._send({"phase": "done"})
+            return job.result, job.http_status
+
+        job.future = self.executor.submit(run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+
+export_job_manager = ExportJobManager()
@@ -1,11 +1,26 @@
+import hashlib
+import json
 import logging
 import os
 import requests
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import folder_paths
 
-from .utils.utils import compute_sha256, get_alphanumeric_hash
+from .utils.utils import get_alphanumeric_hash, get_cache_dir
+from .utils.hash_cache import get_hash_cache
+from .utils.upload_ledger import get_upload_ledger
+
+STORE_URL = os.environ.get("SHELLAGENT_STORE_URL", "https://openapi.myshell.ai/public/v1/store")
+# resumable chunked uploads, for receivers implementing the protocol of upload_file_chunked
+CHUNKED_UPLOAD_URL = os.environ.get("SHELLAGENT_CHUNKED_UPLOAD_URL")
+CHUNKED_UPLOAD_THRESHOLD = int(float(os.environ.get("SHELLAGENT_CHUNKED_UPLOAD_THRESHOLD_MB", 64)) * 1024 ** 2)
+CHUNK_SIZE = int(float(os.environ.get("SHELLAGENT_CHUNK_SIZE_MB", 8)) * 1024 ** 2)
+CHUNK_PARALLEL = int(os.environ.get("SHELLAGENT_CHUNK_PARALLEL", 4))
 
 ext_to_type = {
     # image
@@ -27,51 +42,350 @@ ext_to_type = {
     '.m4a': 'audio/mp4',
 }
 
-def upload_file_to_myshell(local_file: str, target_path: str, is_abs) -> str:
-    ''' Now we only support upload file one-by-one
-    '''
+class MultipartFileStream:
+    """multipart/form-data body with a single file part, read from disk chunk by
+    chunk as the request is sent; the sha256 of the file is computed from the
+    same buffers, so the file is read once and memory stays constant."""
+
+    def __init__(self, path, field_name="file", filename=None, content_type="application/octet-stream"):
+        self.boundary = uuid.uuid4().hex
+        filename = (filename or os.path.basename(path)).replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+        self._head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self._file = open(path, "rb")
+        self.file_size = os.fstat(self._file.fileno()).st_size
+        self._sha256 = hashlib.sha256()
+        self._hashed = 0
+        self._pos = 0
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        # lets requests send a Content-Length instead of a chunked body
+        return len(self._head) + self.file_size + len(self._tail)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self) - self._pos
+        out = []
+        while size > 0 and self._pos < len(self):
+            if self._pos < len(self._head):
+                data = self._head[self._pos:self._pos + size]
+            elif self._hashed < self.file_size:
+                data = self._file.read(min(size, self.file_size - self._hashed))
+                if not data:
+                    raise IOError(f"{self._file.name} was truncated during upload")
+                self._sha256.update(data)
+                self._hashed += len(data)
+            else:
+                offset = self._pos - len(self._head) - self.file_size
+                data = self._tail[offset:offset + size]
+            out.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return b"".join(out)
+
+    def hexdigest(self):
+        """sha256 of the file, once the whole body has been read."""
+        if self._hashed != self.file_size:
+            raise IOError(f"{self._file.name} was not fully sent")
+        return self._sha256.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_store_headers():
     MYSHELL_KEY = os.environ.get('MYSHELL_KEY', "OPENSOURCE_FIXED")
     if MYSHELL_KEY is None:
         raise Exception(
             f"MYSHELL_KEY not found in ENV. Please set MYSHELL_KEY in settings for CDN uploading."
         )
-
-    server_url = "https://openapi.myshell.ai/public/v1/store"
-    headers = {
+    return {
         'x-myshell-openapi-key': MYSHELL_KEY
     }
 
-    assert os.path.isfile(local_file)
-    sha256sum = compute_sha256(local_file)
-    start_time = time.time()
-    ext = os.path.splitext(local_file)[1]
-    files = [
-        ('file', (os.path.basename(local_file), open(local_file, 'rb'), ext_to_type[ext.lower()])),
-    ]
-    response = requests.request("POST", server_url, headers=headers, files=files)
-    if response.status_code == 200:
-        end_time = time.time()
-        logging.info(f"{local_file} uploaded, time elapsed: {end_time - start_time}, will be saved to {target_path}")
-        return [sha256sum, response.json()['url'], target_path, is_abs]
-    else:
-        raise Exception(
-            f"[HTTP ERROR] {response.status_code} - {response.text} \n"
-        )
- 
- 
-def collect_local_file(item, mapping_dict={}):
-    input_dir = folder_paths.get_input_directory()
+
+def use_chunked_upload(local_file, chunked_url=CHUNKED_UPLOAD_URL):
+    return chunked_url is not None and os.path.getsize(local_file) >= CHUNKED_UPLOAD_THRESHOLD
+
+
+def find_uploaded(local_file, server_url):
+    """(sha256, url) of `local_file` if its content was hashed in full before and may already
+    be on the store; either is None when unknown. Sampled fingerprints are not used here:
+    they must not decide which bytes of a user input get deployed."""
+    sha256sum = get_hash_cache().lookup(local_file)
+    if sha256sum is None:
+        return None, None
+    return sha256sum, get_upload_ledger().lookup(server_url, sha256sum)
+
+
+def record_upload(local_file, server_url, sha256sum, url, stat_key, size=None):
+    """Remember the sha256 computed while uploading and where the bytes went."""
+    hash_cache = get_hash_cache()
+    if hash_cache.stat_key(local_file) != stat_key:
+        raise Exception(f"{local_file} changed during upload")
+    hash_cache.store(local_file, sha256sum, stat_key=stat_key)
+    get_upload_ledger().record(server_url, sha256sum, url, size=size)
+
+
+class ChunkedUploadState:
+    """Chunks of one file the receiver has acknowledged, persisted under the cache dir
+    so an interrupted upload resumes after a restart. Only valid while the file is unchanged."""
+
+    def __init__(self, server_url, local_file, chunk_size):
+        st = os.stat(local_file)
+        self.real_path = os.path.realpath(local_file)
+        self.file_key = [st.st_size, st.st_mtime_ns, st.st_ino]
+        key = hashlib.sha1(f"{server_url}\n{self.real_path}".encode()).hexdigest()
+        self.path = os.path.join(get_cache_dir(), "chunked_uploads", f"{key}.json")
+        self.chunk_size = chunk_size
+        self.upload_id = None
+        self.chunks = {}  # index -> {"offset", "length", "sha256"}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data["file_key"] == self.file_key and data["chunk_size"] == chunk_size:
+                self.upload_id = data["upload_id"]
+                self.chunks = {int(index): chunk for index, chunk in data["chunks"].items()}
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        with self._lock:
+            data = {
+                "upload_id": self.upload_id, "path": self.real_path, "file_key": self.file_key,
+                "chunk_size": self.chunk_size, "chunks": self.chunks,
+            }
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def ack(self, index, offset, length, sha256sum):
+        with self._lock:
+            self.chunks[index] = {"offset": offset, "length": length, "sha256": sha256sum}
+        self.save()
+
+    def reset(self, upload_id):
+        with self._lock:
+            self.upload_id = upload_id
+            self.chunks = {}
+        self.save()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def upload_file_chunked(local_file, server_url=CHUNKED_UPLOAD_URL, chunk_size=CHUNK_SIZE, parallel=CHUNK_PARALLEL,
+                        max_retries=3, cancel_event=None):
+    """Upload `local_file` in chunks of `chunk_size`, `parallel` at a time; returns (sha256, url, size).
+
+    Receiver protocol (see mock_servers.ChunkedStoreHandler):
+        POST {server}/uploads                  {"filename", "size", "chunk_size"} -> {"upload_id"}
+        PUT  {server}/uploads/{id}/chunks/{i}  chunk bytes, X-Chunk-Sha256 header -> {"index", "sha256"}
+        GET  {server}/uploads/{id}             -> {"chunks": {i: sha256}}
+        POST {server}/uploads/{id}/complete    {"sha256", "chunks"} -> {"url"}
+    Acknowledged chunks are recorded locally; after an interruption only the chunks
+    the receiver does not have are sent again, but the file is still read in full
+    (sequentially, once) to compute its sha256.
+    """
+    server_url = server_url.rstrip("/")
+    headers = get_store_headers()
+    size = os.path.getsize(local_file)
+    num_chunks = max(1, -(-size // chunk_size))
+    state = ChunkedUploadState(server_url, local_file, chunk_size)
+
+    session = requests.Session()
+    retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=(408, 429, 500, 502, 503, 504),
+                  allowed_methods=["GET", "PUT", "POST"], raise_on_status=False)
+    session.mount("http://", HTTPAdapter(pool_maxsize=parallel, max_retries=retry))
+    session.mount("https://", HTTPAdapter(pool_maxsize=parallel, max_retries=retry))
+    try:
+        # resume: keep the chunks both sides agree on
+        acked = {}
+        if state.upload_id is not None:
+            response = session.get(f"{server_url}/uploads/{state.upload_id}", headers=headers, timeout=(3.05, 30))
+            if response.status_code == 200:
+                received = {int(index): sha256sum for index, sha256sum in response.json()["chunks"].items()}
+                acked = {index: chunk for index, chunk in state.chunks.items() if received.get(index) == chunk["sha256"]}
+                logging.info(f"resuming upload of {local_file}: {len(acked)}/{num_chunks} chunks already sent")
+            else:
+                state.upload_id = None
+        if state.upload_id is None:
+            response = session.post(f"{server_url}/uploads", headers=headers, timeout=(3.05, 30), json={
+                "filename": os.path.basename(local_file), "size": size, "chunk_size": chunk_size,
+            })
+            if response.status_code != 200:
+                raise Exception(f"[HTTP ERROR] {response.status_code} - {response.text} \n")
+            state.reset(response.json()["upload_id"])
+
+        def send_chunk(index, offset, data, sha256sum):
+            response = session.put(
+                f"{server_url}/uploads/{state.upload_id}/chunks/{index}", data=data, timeout=(3.05, 120),
+                headers={**headers, "Content-Type": "application/octet-stream", "X-Chunk-Sha256": sha256sum,
+                         "Content-Range": f"bytes {offset}-{offset + len(data) - 1}/{size}"},
+            )
+            if response.status_code != 200:
+                raise Exception(f"[HTTP ERROR] chunk {index}: {response.status_code} - {response.text} \n")
+            state.ack(index, offset, len(data), sha256sum)
+
+        # one sequential reader hashes the whole file, at most 2 * parallel chunks are in memory
+        file_sha256 = hashlib.sha256()
+        in_flight = threading.BoundedSemaphore(2 * parallel)
+        futures = []
+
+        def failed():
+            return any(future.done() and not future.cancelled() and future.exception() is not None for future in futures)
+
+        with ThreadPoolExecutor(max_workers=parallel) as executor, open(local_file, "rb") as f:
+            for index in range(num_chunks):
+                if failed() or (cancel_event is not None and cancel_event.is_set()):
+                    # fail fast, the chunks sent so far are kept for the next attempt
+                    for future in futures:
+                        future.cancel()
+                    break
+                offset = index * chunk_size
+                data = f.read(chunk_size)
+                file_sha256.update(data)
+                sha256sum = hashlib.sha256(data).hexdigest()
+                if acked.get(index, {}).get("sha256") == sha256sum:
+                    continue
+                in_flight.acquire()
+                future = executor.submit(send_chunk, index, offset, data, sha256sum)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+        errors = [future.exception() for future in futures if not future.cancelled() and future.exception() is not None]
+        if errors:
+            raise errors[0]
+        if cancel_event is not None and cancel_event.is_set():
+            raise Exception(f"upload of {local_file} was cancelled")
+
+        response = session.post(f"{server_url}/uploads/{state.upload_id}/complete", headers=headers, timeout=(3.05, 120),
+                                json={"sha256": file_sha256.hexdigest(), "chunks": num_chunks})
+        if response.status_code != 200:
+            raise Exception(f"[HTTP ERROR] {response.status_code} - {response.text} \n")
+        state.remove()
+        return file_sha256.hexdigest(), response.json()["url"], size
+    finally:
+        session.close()
+
+
+def media_extension(item):
+    """Lower-cased extension of `item` if it names an uploadable file type, else None; no disk access."""
+    for path in (item, os.path.normpath(item)):
+        ext = os.path.splitext(path)[1].lower()
+        if ext in ext_to_type:
+            return ext
+    return None
+
+
+class InputDirListing:
+    """Names of the regular files of each input (sub)directory, rescanned only when the
+    directory's mtime changes: adding, removing or renaming a file always updates it."""
+
+    RACY_SECONDS = 2  # listings taken right after a change may miss a same-tick update
+
+    def __init__(self):
+        self._dirs = {}  # directory -> (mtime_ns, file names, lower-cased file names)
+        self._lock = threading.Lock()
+
+    def files(self, directory, mtime_ns):
+        """(file names, lower-cased file names) of `directory`."""
+        with self._lock:
+            cached = self._dirs.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1:]
+        try:
+            with os.scandir(directory) as entries:
+                names = frozenset(entry.name for entry in entries if entry.is_file())
+        except OSError:
+            return frozenset(), frozenset()
+        folded = frozenset(name.lower() for name in names)
+        if time.time_ns() - mtime_ns > self.RACY_SECONDS * 10 ** 9:
+            with self._lock:
+                self._dirs[directory] = (mtime_ns, names, folded)
+        return names, folded
+
+
+_input_dir_listing = InputDirListing()
+
+
+class LocalFileCollector:
+    """Resolves input strings to local files for one export. Strings without a media
+    extension never touch the disk, stat results are cached for the export, and
+    files of the input directory are looked up in cached directory listings."""
+
+    def __init__(self, input_dir=None):
+        self.input_dir = input_dir or folder_paths.get_input_directory()
+        self._isfile = {}
+        self._dir_mtimes = {}
+
+    def isfile(self, path):
+        result = self._isfile.get(path)
+        if result is None:
+            result = self._isfile[path] = os.path.isfile(path)
+        return result
+
+    def _dir_mtime(self, directory):
+        if directory not in self._dir_mtimes:
+            try:
+                self._dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._dir_mtimes[directory] = None
+        return self._dir_mtimes[directory]
+
+    def is_input_file(self, item):
+        parts = item.replace(os.sep, "/").split("/")
+        if os.path.isabs(item) or ".." in parts or "" in parts[:-1]:
+            # not a plain relative path, let the os resolve it
+            return self.isfile(os.path.join(self.input_dir, item))
+        directory = os.path.join(self.input_dir, *parts[:-1])
+        mtime_ns = self._dir_mtime(directory)
+        if mtime_ns is None:
+            return False
+        names, folded = _input_dir_listing.files(directory, mtime_ns)
+        if parts[-1] in names:
+            return True
+        # `Photo.PNG` for `photo.png`: only the os knows whether the file system ignores case
+        return parts[-1].lower() in folded and self.isfile(os.path.join(self.input_dir, item))
+
+
+def collect_local_file(item, mapping_dict={}, collector=None):
     if not isinstance(item, str):
         return
+    # most inputs are prompts, numbers and model names: reject them before any syscall
+    if media_extension(item) is None:
+        return
+    if collector is None:
+        collector = LocalFileCollector()
+    input_dir = collector.input_dir
     abspath = os.path.abspath(item)
     input_abspath = os.path.join(input_dir, item)
     # required file type
     is_abs = False
-    if os.path.isfile(abspath):
+    if collector.isfile(abspath):
         fpath = abspath
         is_abs = True
         
-    elif os.path.isfile(input_abspath):
+    elif collector.is_input_file(item):
         fpath = input_abspath
     else:
         fpath = None
@@ -89,23 +403,47 @@ def collect_local_file(item, mapping_dict={}):
         else:
             return
 
-def process_local_file_path_async(mapping_dict, max_workers=10):
-    # Using ThreadPoolExecutor for concurrent file processing
+def local_file_candidates(item, input_dir=None):
+    """Every path collect_local_file may resolve `item` to, whether it exists or not."""
+    if not isinstance(item, str) or media_extension(item) is None:
+        return []
+    return [os.path.abspath(item), os.path.join(input_dir or folder_paths.get_input_directory(), item)]
+
+def pending_upload_bytes(mapping_dict):
+    """Bytes the files of `mapping_dict` would upload; files with a known sha256 already in the storage backend are free."""
+    from .storage_backends import get_storage_backend
+    backend = get_storage_backend()
+    hash_cache = get_hash_cache()
+    total = 0
+    for source_path, _, _ in mapping_dict.values():
+        sha256sum = hash_cache.lookup(source_path)
+        if sha256sum is None or not backend.is_uploaded(source_path, sha256sum):
+            total += os.path.getsize(source_path)
+    return total
+
+def process_local_file_path_async(mapping_dict, max_workers=None, progress_callback=None, cancel_event=None):
+    """Upload the files of `mapping_dict` to the configured storage backend; each value is
+    replaced by [sha256, url, target_path, is_abs]. Returns the per-file upload report,
+    setting `cancel_event` stops the uploads still running."""
+    from .storage_backends import get_storage_backend
+    from .upload_service import UploadError
+    backend = get_storage_backend()
     logging.info(f"upload start, {len(mapping_dict)} to upload")
     start_time = time.time()
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit tasks to the executor
-        futures = {executor.submit(upload_file_to_myshell, source_path, target_path, is_abs): filename for filename, (source_path, target_path, is_abs) in mapping_dict.items()}
-        logging.info("submit done")
-        # Collect the results as they complete
-        for future in as_completed(futures):
-            filename = futures[future]
-            try:
-                result = future.result()
-                mapping_dict[filename] = result
-            except Exception as e:
-                del mapping_dict[filename]
-                raise NotImplementedError(f"Error processing {filename}: {e}")
+    try:
+        report = backend.upload_many(mapping_dict, max_concurrency=max_workers, progress_callback=progress_callback,
+                                     cancel_event=cancel_event)
+    except UploadError as e:
+        for item in e.report:
+            if item["status"] == "failed":
+                del mapping_dict[item["filename"]]
+        raise
+    for item in report:
+        mapping_dict[item["filename"]] = [item["sha256"], item["url"], item["target_path"], mapping_dict[item["filename"]][2]]
     end_time = time.time()
-    logging.info(f"upload end, elapsed time: {end_time - start_time}")
-    return
\ No newline at end of file
+    logging.info(
+        f"upload end, elapsed time: {end_time - start_time}, "
+        f"{sum(item['status'] == 'uploaded' for item in report)} uploaded, {sum(item['status'] == 'cached' for item in report)} already stored, "
+        f"{backend.name} backend stats: {backend.stats.to_dict()}"
+    )
+    return report
@@ -1,4 +1,9 @@
+import asyncio
+import os
 import struct
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 import aiohttp
 from typing import List, Union, Any, Optional
@@ -50,12 +55,37 @@ class BinaryEventTypes:
     
 max_output_id_length = 24
 
-async def send_image(image_data, sid=None, output_id:str = None):
+PREVIEW_WORKERS = int(os.environ.get("SHELLAGENT_PREVIEW_WORKERS", 2))
+PREVIEW_QUEUE_DEPTH = int(os.environ.get("SHELLAGENT_PREVIEW_QUEUE_DEPTH", 8))
+
+_preview_executor = None
+_preview_executor_lock = threading.Lock()
+_preview_slots = weakref.WeakKeyDictionary()  # event loop -> semaphore bounding the previews queued for encoding
+
+
+def get_preview_executor():
+    global _preview_executor
+    with _preview_executor_lock:
+        if _preview_executor is None:
+            _preview_executor = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="shellagent-preview")
+        return _preview_executor
+
+
+def _preview_slot(loop):
+    if loop not in _preview_slots:
+        _preview_slots[loop] = asyncio.Semaphore(PREVIEW_QUEUE_DEPTH)
+    return _preview_slots[loop]
+
+
+def encode_preview(image_data, output_id):
+    """Resize and encode a preview image into a complete PREVIEW_IMAGE message
+    (event header included), returned as a view of the encode buffer so it is
+    sent as is. CPU bound, runs on the preview workers."""
     max_length = max_output_id_length
     output_id = output_id[:max_length]
     padded_output_id = output_id.ljust(max_length, '\x00')
     encoded_output_id = padded_output_id.encode('ascii', 'replace')
-    
+
     image_type = image_data[0]
     image = image_data[1]
     max_size = image_data[2]
@@ -76,43 +106,47 @@ async def send_image(image_data, sid=None, output_id:str = None):
         type_num = 3
 
     bytesIO = BytesIO()
+    # the event header goes first, so the buffer is the finished message
+    bytesIO.write(encode_header(BinaryEventTypes.PREVIEW_IMAGE))
     header = struct.pack(">I", type_num)
     # 4 bytes for the type
     bytesIO.write(header)
-    # 10 bytes for the output_id
-    position_before = bytesIO.tell()
+    # max_output_id_length bytes for the output_id
     bytesIO.write(encoded_output_id)
-    position_after = bytesIO.tell()
-    bytes_written = position_after - position_before
-    print(f"Bytes written: {bytes_written}")
-    
+
     image.save(bytesIO, format=image_type, quality=quality, compress_level=1)
-    preview_bytes = bytesIO.getvalue()
-    await send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
-        
+    return bytesIO.getbuffer()
+
+
+async def send_image(image_data, sid=None, output_id:str = None):
+    loop = asyncio.get_running_loop()
+    # previews past the queue depth wait here, on the loop, instead of piling up in the pool
+    async with _preview_slot(loop):
+        message = await loop.run_in_executor(get_preview_executor(), encode_preview, image_data, output_id)
+    await send_message(message, sid=sid)
+
 async def send_socket_catch_exception(function, message):
     try:
         await function(message)
     except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError) as err:
         print("send error:", err)
 
-def encode_bytes(event, data):
+def encode_header(event):
     if not isinstance(event, int):
         raise RuntimeError(f"Binary event types must be integers, got {event}")
+    return struct.pack(">I", event)
 
-    packed = struct.pack(">I", event)
-    message = bytearray(packed)
-    message.extend(data)
-    return message
-
-async def send_bytes(event, data, sid=None):
-    message = encode_bytes(event, data)
-    
-    print("sending image to ", event, sid)
+def encode_bytes(event, data):
+    # a single copy of the payload, shared by every socket the message goes to
+    return b"".join((encode_header(event), data))
 
+async def send_message(message, sid=None):
+    """Send an encoded binary message to one socket, or to all of them at once."""
     if sid is None:
         _sockets = list(sockets.values())
-        for ws in _sockets:
-            await send_socket_catch_exception(ws.send_bytes, message)
+        await asyncio.gather(*(send_socket_catch_exception(ws.send_bytes, message) for ws in _sockets))
     elif sid in sockets:
-        await send_socket_catch_exception(sockets[sid].send_bytes, message)
\ No newline at end of file
+        await send_socket_catch_exception(sockets[sid].send_bytes, message)
+
+async def send_bytes(event, data, sid=None):
+    await send_message(encode_bytes(event, data), sid=sid)
\ No newline at end of file
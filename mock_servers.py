@@ -0,0 +1,282 @@
+"""
+Local stand-ins for the remote services used during export, so the clients
+can be exercised offline.
+
+    python mock_servers.py model-searcher --port 8190 --catalog model_info.json
+    python mock_servers.py store --port 8191
+    python mock_servers.py chunked-store --port 8192
+    python mock_servers.py s3 --port 8193
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInServer:
+    """Runs `handler_cls` on a background thread; `url` is the base url."""
+
+    def __init__(self, handler_cls, host="127.0.0.1", port=0, **state):
+        state.setdefault("lock", threading.Lock())
+        handler = type(handler_cls.__name__, (handler_cls,), {"state": state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.state = state
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    state = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def maybe_fail(self):
+        # state["fail_times"]: number of requests answered with state["fail_status"] (503) before succeeding
+        with self.state["lock"]:
+            self.state.setdefault("requests", []).append(self.path)
+            if self.state.get("fail_times", 0) > 0:
+                self.state["fail_times"] -= 1
+                fail = True
+            else:
+                fail = False
+        time.sleep(self.state.get("delay", 0))
+        if fail:
+            self.send_json({"error": "unavailable"}, status=self.state.get("fail_status", 503))
+        return fail
+
+
+class ModelSearcherHandler(_JSONHandler):
+    """POST {"sha256": [...]} -> [[url, ...], ...] from state["urls"]."""
+
+    def do_POST(self):
+        model_ids = self.read_json()["sha256"]
+        if self.maybe_fail():
+            return
+        with self.state["lock"]:
+            self.state.setdefault("lookups", []).extend(model_ids)
+        urls = self.state.get("urls", {})
+        self.send_json([urls.get(model_id, []) for model_id in model_ids])
+
+
+def model_searcher(urls=None, **kwargs):
+    return StandInServer(ModelSearcherHandler, urls=urls or {}, **kwargs)
+
+
+class StoreHandler(_JSONHandler):
+    """POST <multipart file> -> {"url": ...}; the body is drained, not parsed."""
+
+    def do_POST(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        received = 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1024 ** 2))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            received += len(chunk)
+        if self.maybe_fail():
+            return
+        with self.state["lock"]:
+            self.state["uploads"] = self.state.get("uploads", 0) + 1
+            self.state["bytes_received"] = self.state.get("bytes_received", 0) + received
+            upload_id = self.state["uploads"]
+        self.send_json({"url": f"https://cdn.example.com/store/{upload_id}"})
+
+
+def store(**kwargs):
+    return StandInServer(StoreHandler, **kwargs)
+
+
+class ChunkedStoreHandler(_JSONHandler):
+    """Receiver of file_upload.upload_file_chunked:
+
+        POST /uploads                  {"filename", "size", "chunk_size"} -> {"upload_id"}
+        PUT  /uploads/{id}/chunks/{i}  chunk bytes, X-Chunk-Sha256 header -> {"index", "sha256"}
+        GET  /uploads/{id}             -> {"chunks": {i: sha256}}
+        POST /uploads/{id}/complete    {"sha256", "chunks"} -> {"url"}
+
+    Chunk checksums are verified on arrival; with state["keep_data"] the chunks are
+    kept in memory and the sha256 of the whole file is verified on completion.
+    """
+
+    def _upload(self, upload_id):
+        upload = self.state.setdefault("uploads", {}).get(upload_id)
+        if upload is None:
+            self.send_json({"error": "unknown upload"}, status=404)
+        return upload
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        data = self.read_json()
+        if self.maybe_fail():
+            return
+        if parts == ["uploads"]:
+            upload_id = uuid.uuid4().hex
+            with self.state["lock"]:
+                self.state.setdefault("uploads", {})[upload_id] = {**data, "chunks": {}, "data": {}}
+            self.send_json({"upload_id": upload_id})
+        elif len(parts) == 3 and parts[0] == "uploads" and parts[2] == "complete":
+            upload = self._upload(parts[1])
+            if upload is None:
+                return
+            if sorted(upload["chunks"]) != list(range(data["chunks"])):
+                self.send_json({"error": "missing chunks"}, status=409)
+                return
+            if self.state.get("keep_data"):
+                digest = hashlib.sha256(b"".join(upload["data"][i] for i in range(data["chunks"]))).hexdigest()
+                if digest != data["sha256"]:
+                    self.send_json({"error": "sha256 mismatch"}, status=422)
+                    return
+            upload["sha256"] = data["sha256"]
+            self.send_json({"url": f"https://cdn.example.com/store/{data['sha256']}"})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_PUT(self):
+        parts = self.path.strip("/").split("/")
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.maybe_fail():
+            return
+        if len(parts) != 4 or parts[0] != "uploads" or parts[2] != "chunks":
+            self.send_json({"error": "not found"}, status=404)
+            return
+        upload = self._upload(parts[1])
+        if upload is None:
+            return
+        digest = hashlib.sha256(body).hexdigest()
+        if digest != self.headers.get("X-Chunk-Sha256"):
+            self.send_json({"error": "chunk checksum mismatch"}, status=422)
+            return
+        index = int(parts[3])
+        with self.state["lock"]:
+            upload["chunks"][index] = digest
+            if self.state.get("keep_data"):
+                upload["data"][index] = body
+            self.state["bytes_received"] = self.state.get("bytes_received", 0) + len(body)
+        self.send_json({"index": index, "sha256": digest})
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if self.maybe_fail():
+            return
+        if len(parts) != 2 or parts[0] != "uploads":
+            self.send_json({"error": "not found"}, status=404)
+            return
+        upload = self._upload(parts[1])
+        if upload is not None:
+            self.send_json({"chunks": {str(index): digest for index, digest in upload["chunks"].items()}})
+
+
+def chunked_store(**kwargs):
+    return StandInServer(ChunkedStoreHandler, **kwargs)
+
+
+class S3Handler(_JSONHandler):
+    """Path-style S3 subset: PUT / HEAD / GET /{bucket}/{key}. Requests must carry a
+    signature v4 Authorization header, payloads are checked against x-amz-content-sha256
+    (the signature itself is not verified)."""
+
+    def _authorized(self):
+        if not self.headers.get("Authorization", "").startswith("AWS4-HMAC-SHA256 Credential="):
+            self.send_json({"error": "AccessDenied"}, status=403)
+            return False
+        return True
+
+    def _object(self):
+        return self.state.setdefault("objects", {}).get(self.path.split("?", 1)[0])
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.maybe_fail() or not self._authorized():
+            return
+        digest = hashlib.sha256(body).hexdigest()
+        if self.headers.get("x-amz-content-sha256") not in (digest, "UNSIGNED-PAYLOAD"):
+            self.send_json({"error": "XAmzContentSHA256Mismatch"}, status=400)
+            return
+        with self.state["lock"]:
+            self.state.setdefault("objects", {})[self.path.split("?", 1)[0]] = {
+                "size": len(body), "sha256": digest, "data": body if self.state.get("keep_data") else None,
+            }
+            self.state["bytes_received"] = self.state.get("bytes_received", 0) + len(body)
+        self.send_response(200)
+        self.send_header("ETag", f'"{hashlib.md5(body).hexdigest()}"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        if self.maybe_fail() or not self._authorized():
+            return
+        obj = self._object()
+        self.send_response(200 if obj is not None else 404)
+        self.send_header("Content-Length", str(obj["size"] if obj is not None else 0))
+        self.end_headers()
+
+    def do_GET(self):
+        if self.maybe_fail() or not self._authorized():
+            return
+        obj = self._object()
+        if obj is None or obj["data"] is None:
+            self.send_json({"error": "NoSuchKey"}, status=404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(obj["size"]))
+        self.end_headers()
+        self.wfile.write(obj["data"])
+
+
+def s3(**kwargs):
+    return StandInServer(S3Handler, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("service", choices=["model-searcher", "store", "chunked-store", "s3"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8190)
+    parser.add_argument("--catalog", help="model_info.json used to answer model searcher lookups")
+    args = parser.parse_args()
+
+    if args.service == "model-searcher":
+        urls = {}
+        if args.catalog:
+            with open(args.catalog) as f:
+                urls = {model_id: [item["url"] for item in info["links"]] for model_id, info in json.load(f).items()}
+        server = model_searcher(urls, host=args.host, port=args.port)
+    elif args.service == "chunked-store":
+        server = chunked_store(host=args.host, port=args.port)
+    elif args.service == "s3":
+        server = s3(host=args.host, port=args.port)
+    else:
+        server = store(host=args.host, port=args.port)
+    print(f"{args.service} listening on {server.url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .utils.utils import get_cache_dir
+
+MODEL_SEARCHER_URL = os.environ.get("SHELLAGENT_MODEL_SEARCHER_URL", "https://models-searcher.myshell.life/search_urls")
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class SearchResultCache:
+    """sha256 -> urls with a TTL; misses are cached too (with a shorter TTL)."""
+
+    def __init__(self, db_path, hit_ttl=7 * 24 * 3600, miss_ttl=3600):
+        self.db_path = db_path
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results ("
+                "sha256 TEXT PRIMARY KEY, urls TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model_ids):
+        results = {}
+        conn = self._connect()
+        now = time.time()
+        for model_id in model_ids:
+            row = conn.execute(
+                "SELECT urls, expires_at FROM search_results WHERE sha256 = ?", (model_id,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                results[model_id] = json.loads(row[0])
+        return results
+
+    def put_many(self, results):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO search_results (sha256, urls, expires_at) VALUES (?, ?, ?)",
+                [
+                    (model_id, json.dumps(urls), now + (self.hit_ttl if urls else self.miss_ttl))
+                    for model_id, urls in results.items()
+                ],
+            )
+
+
+class ModelSearcherClient:
+    def __init__(self, url=MODEL_SEARCHER_URL, cache=None, batch_size=64, timeout=(3.05, 10),
+                 max_retries=2, backoff_factor=0.5, deadline=20, cooldown=300):
+        self.url = url
+        self.cache = cache
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.deadline = deadline  # total time budget of one search call, retries included
+        self.cooldown = cooldown  # skip the searcher for a while after it failed
+        self._unavailable_until = 0
+        self.session = requests.Session()
+        # retries are done in _search_batch, so that they stay within the deadline
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _search_batch(self, model_ids, deadline):
+        connect_timeout, read_timeout = self.timeout
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError("model searcher deadline exceeded")
+            try:
+                response = self.session.post(
+                    self.url, json={"sha256": model_ids},
+                    timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)),
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    break
+            time.sleep(max(0, min(self.backoff_factor * 2 ** attempt, deadline - time.time())))
+        response.raise_for_status()
+        items = response.json()
+        if len(items) != len(model_ids):
+            raise ValueError(f"expected {len(model_ids)} results from model searcher, got {len(items)}")
+        return {model_id: item[:10] for model_id, item in zip(model_ids, items)}
+
+    def search(self, model_ids):
+        """Return {model_id: urls} for the ids that could be resolved; ids are absent on failure."""
+        model_ids = list(dict.fromkeys(model_ids))
+        results = self.cache.get_many(model_ids) if self.cache is not None else {}
+        pending = [model_id for model_id in model_ids if model_id not in results]
+        if len(pending) == 0:
+            return results
+        if time.time() < self._unavailable_until:
+            logging.warning("model searcher unavailable, skipping lookup")
+            return results
+
+        deadline = time.time() + self.deadline
+        for i in range(0, len(pending), self.batch_size):
+            if time.time() >= deadline:
+                logging.warning(f"model searcher deadline exceeded, {len(pending) - i} lookups skipped")
+                break
+            batch = pending[i:i + self.batch_size]
+            try:
+                batch_results = self._search_batch(batch, deadline)
+            except Exception as e:
+                logging.warning(f"model searcher request failed: {e}")
+                self._unavailable_until = time.time() + self.cooldown
+                break
+            if self.cache is not None:
+                self.cache.put_many(batch_results)
+            results.update(batch_results)
+        return results
+
+
+class StreamingSearch:
+    """Looks ids up while they are still being produced: a background thread
+    sends whatever has been submitted so far as one batch."""
+
+    def __init__(self, client):
+        self.client = client
+        self.results = {}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = None in batch
+            batch = [model_id for model_id in batch if model_id is not None]
+            if batch:
+                try:
+                    self.results.update(self.client.search(batch))
+                except Exception as e:
+                    logging.warning(f"model searcher lookup failed: {e}")
+            if done:
+                return
+
+    def submit(self, model_id):
+        self._queue.put(model_id)
+
+    def close(self, timeout=None):
+        """Wait for the outstanding lookups, at most `timeout` seconds (the client
+        deadline by default), and return {model_id: urls} of those that finished."""
+        self._queue.put(None)
+        self._thread.join(self.client.deadline if timeout is None else timeout)
+        if self._thread.is_alive():
+            logging.warning("model searcher did not answer in time, continuing without its results")
+        return dict(self.results)
+
+
+_model_searcher_client = None
+_model_searcher_lock = threading.Lock()
+
+
+def get_model_searcher_client():
+    global _model_searcher_client
+    with _model_searcher_lock:
+        if _model_searcher_client is None:
+            cache = SearchResultCache(os.path.join(get_cache_dir(), "model_searcher.sqlite3"))
+            _model_searcher_client = ModelSearcherClient(cache=cache)
+        return _model_searcher_client
@@ -0,0 +1,376 @@
+"""
+Where exported local files are uploaded to, selected with
+SHELLAGENT_STORAGE_BACKEND:
+
+    http   the MyShell store (default), through the async upload service
+    local  a content-addressed directory (SHELLAGENT_LOCAL_STORE_DIR), e.g. served by a CDN
+    s3     an S3-compatible bucket, requests signed with AWS signature v4
+
+Every backend takes {filename: (source_path, target_path, is_abs)}, returns
+one report per file (see upload_service) and keeps throughput statistics.
+"""
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote, urlsplit, parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .file_upload import (
+    STORE_URL, ext_to_type, find_uploaded, record_upload, use_chunked_upload,
+)
+from .upload_service import UploadError, get_upload_service
+from .utils.hash_cache import get_hash_cache
+from .utils.upload_ledger import get_upload_ledger
+from .utils.utils import get_cache_dir
+
+STORAGE_BACKEND = os.environ.get("SHELLAGENT_STORAGE_BACKEND", "http")
+
+
+class TransferStats:
+    def __init__(self):
+        self.files_uploaded = 0
+        self.files_cached = 0
+        self.files_failed = 0
+        self.bytes = 0
+        self.seconds = 0.0  # wall time of the calls that uploaded something
+        self.last_bytes_per_sec = None
+        self._lock = threading.Lock()
+
+    def add(self, report, seconds):
+        uploaded = [item for item in report if item.get("status") == "uploaded"]
+        nbytes = sum(item.get("bytes", 0) for item in uploaded)
+        with self._lock:
+            self.files_uploaded += len(uploaded)
+            self.files_cached += sum(item.get("status") == "cached" for item in report)
+            self.files_failed += sum(item.get("status") == "failed" for item in report)
+            if nbytes > 0:
+                self.bytes += nbytes
+                self.seconds += seconds
+                self.last_bytes_per_sec = nbytes / seconds if seconds > 0 else None
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "files_uploaded": self.files_uploaded,
+                "files_cached": self.files_cached,
+                "files_failed": self.files_failed,
+                "bytes": self.bytes,
+                "seconds": self.seconds,
+                "bytes_per_sec": self.bytes / self.seconds if self.seconds > 0 else None,
+                "last_bytes_per_sec": self.last_bytes_per_sec,
+            }
+
+
+class StorageBackend:
+    name = None
+
+    def __init__(self):
+        self.stats = TransferStats()
+
+    def ledger_url(self, local_file):
+        """Key of this backend in the upload ledger."""
+        raise NotImplementedError
+
+    def is_uploaded(self, local_file, sha256sum):
+        return get_upload_ledger().lookup(self.ledger_url(local_file), sha256sum) is not None
+
+    def _upload_many(self, mapping_dict, max_concurrency=None, progress_callback=None, cancel_event=None):
+        raise NotImplementedError
+
+    def upload_many(self, mapping_dict, max_concurrency=None, progress_callback=None, cancel_event=None):
+        start = time.time()
+        try:
+            report = self._upload_many(mapping_dict, max_concurrency=max_concurrency, progress_callback=progress_callback,
+                                       cancel_event=cancel_event)
+        except UploadError as e:
+            self.stats.add(e.report, time.time() - start)
+            raise
+        self.stats.add(report, time.time() - start)
+        return report
+
+
+class HTTPStoreBackend(StorageBackend):
+    name = "http"
+
+    def __init__(self, service=None):
+        super().__init__()
+        self.service = service or get_upload_service()
+
+    def ledger_url(self, local_file):
+        if self.service.chunked_url is not None and use_chunked_upload(local_file, self.service.chunked_url):
+            return self.service.chunked_url
+        return self.service.server_url or STORE_URL
+
+    def _upload_many(self, mapping_dict, max_concurrency=None, progress_callback=None, cancel_event=None):
+        return self.service.upload_many(mapping_dict, max_concurrency=max_concurrency, progress_callback=progress_callback,
+                                        cancel_event=cancel_event)
+
+
+class ThreadedBackend(StorageBackend):
+    """Backends uploading one file per worker thread; the first failure cancels the files not started yet."""
+
+    def __init__(self, max_workers=8):
+        super().__init__()
+        self.max_workers = max_workers
+
+    def upload_file(self, local_file):
+        """Upload one file whose content is not known to be stored; returns (sha256, url, size),
+        size is None if the content turned out to be stored already."""
+        raise NotImplementedError
+
+    def _upload_one(self, filename, source_path, target_path):
+        report = {
+            "filename": filename, "source_path": source_path, "target_path": target_path,
+            "status": "pending", "sha256": None, "url": None, "bytes": 0, "attempts": 1, "seconds": 0.0, "error": None,
+        }
+        start = time.time()
+        try:
+            ledger_url = self.ledger_url(source_path)
+            sha256sum, url = find_uploaded(source_path, ledger_url)
+            if url is None and sha256sum is not None:
+                url = self.find_stored(source_path, sha256sum)
+                if url is not None:
+                    get_upload_ledger().record(ledger_url, sha256sum, url)
+            if url is not None:
+                report.update(status="cached", sha256=sha256sum, url=url)
+                return report
+            stat_key = get_hash_cache().stat_key(source_path)
+            sha256sum, url, size = self.upload_file(source_path)
+            record_upload(source_path, ledger_url, sha256sum, url, stat_key, size=size)
+            report.update(status="uploaded" if size is not None else "cached", sha256=sha256sum, url=url, bytes=size or 0)
+            return report
+        except Exception as e:
+            report.update(status="failed", error=str(e))
+            raise UploadError(f"Error processing {filename}: {e}", [report])
+        finally:
+            report["seconds"] = time.time() - start
+
+    def find_stored(self, local_file, sha256sum):
+        """url of content already in the backend but missing from the ledger, or None."""
+        return None
+
+    def _upload_many(self, mapping_dict, max_concurrency=None, progress_callback=None, cancel_event=None):
+        items = list(mapping_dict.items())
+        reports = {}
+        with ThreadPoolExecutor(max_workers=max_concurrency or self.max_workers) as executor:
+            futures = {
+                executor.submit(self._upload_one, filename, source_path, target_path): filename
+                for filename, (source_path, target_path, _) in items
+            }
+            try:
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            reports[futures[future]] = future.result()
+                        except UploadError as e:
+                            reports[futures[future]] = e.report[0]
+                            raise
+                        if progress_callback is not None:
+                            progress_callback(len(reports), len(items))
+                    if pending and cancel_event is not None and cancel_event.is_set():
+                        raise UploadError("upload cancelled")
+            except BaseException as e:
+                for future in futures:
+                    future.cancel()
+                for future, filename in futures.items():
+                    if filename not in reports:
+                        if future.cancelled():
+                            reports[filename] = {"filename": filename, "status": "cancelled"}
+                        else:
+                            try:
+                                reports[filename] = future.result()
+                            except UploadError as error:
+                                reports[filename] = error.report[0]
+                report_list = [reports[filename] for filename, _ in items]
+                if isinstance(e, UploadError):
+                    raise UploadError(str(e), report_list) from e
+                raise
+        return [reports[filename] for filename, _ in items]
+
+
+class LocalStorageBackend(ThreadedBackend):
+    """Content-addressed directory: <root>/<sha[:2]>/<sha[2:4]>/<sha><ext>. Files are hashed
+    while they are copied; the urls are file:// urls, or under `base_url` if it is served."""
+    name = "local"
+
+    def __init__(self, root=None, base_url=None, max_workers=8):
+        super().__init__(max_workers=max_workers)
+        self.root = os.path.abspath(root or os.environ.get("SHELLAGENT_LOCAL_STORE_DIR") or os.path.join(get_cache_dir(), "store"))
+        self.base_url = (base_url or os.environ.get("SHELLAGENT_LOCAL_STORE_URL") or "").rstrip("/") or None
+
+    def ledger_url(self, local_file):
+        return f"file://{self.root}"
+
+    def object_path(self, sha256sum, ext):
+        return os.path.join(self.root, sha256sum[:2], sha256sum[2:4], sha256sum + ext.lower())
+
+    def url_for(self, object_path):
+        rel_path = os.path.relpath(object_path, self.root).replace(os.sep, "/")
+        if self.base_url is not None:
+            return f"{self.base_url}/{rel_path}"
+        return f"file://{quote(object_path)}"
+
+    def find_stored(self, local_file, sha256sum):
+        object_path = self.object_path(sha256sum, os.path.splitext(local_file)[1])
+        return self.url_for(object_path) if os.path.isfile(object_path) else None
+
+    def is_uploaded(self, local_file, sha256sum):
+        return self.find_stored(local_file, sha256sum) is not None
+
+    def upload_file(self, local_file):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".incoming-{threading.get_ident()}-{time.time_ns()}")
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            with open(local_file, "rb") as src, open(tmp_path, "wb") as dst:
+                while True:
+                    chunk = src.read(1024 ** 2)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    dst.write(chunk)
+                    size += len(chunk)
+            object_path = self.object_path(sha256.hexdigest(), os.path.splitext(local_file)[1])
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(tmp_path, object_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return sha256.hexdigest(), self.url_for(object_path), size
+
+
+def sign_request_v4(method, url, headers, payload_hash, access_key, secret_key, region, service="s3", now=None):
+    """AWS signature version 4: returns `headers` plus x-amz-date, x-amz-content-sha256 and Authorization."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = amz_date[:8]
+    parsed = urlsplit(url)
+
+    signed = {key.lower(): " ".join(str(value).split()) for key, value in headers.items()}
+    signed["host"] = parsed.netloc
+    signed["x-amz-date"] = amz_date
+    signed["x-amz-content-sha256"] = payload_hash
+    signed_headers = ";".join(sorted(signed))
+    canonical_query = "&".join(
+        f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}"
+        for key, value in sorted(parse_qsl(parsed.query, keep_blank_values=True))
+    )
+    canonical_request = "\n".join([
+        method,
+        parsed.path or "/",  # already uri-encoded, s3 does not encode it twice
+        canonical_query,
+        "".join(f"{key}:{signed[key]}\n" for key in sorted(signed)),
+        signed_headers,
+        payload_hash,
+    ])
+    scope = f"{date}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()])
+    key = f"AWS4{secret_key}".encode()
+    for part in (date, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    result = dict(headers)
+    result["x-amz-date"] = amz_date
+    result["x-amz-content-sha256"] = payload_hash
+    result["Authorization"] = f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}"
+    return result
+
+
+class S3StorageBackend(ThreadedBackend):
+    """Objects keyed by content (<prefix><sha256><ext>), path-style urls, signature v4.
+    The sha256 is needed for the key before the upload, so unknown files are hashed
+    first (through the hash cache) and the store verifies the payload against it."""
+    name = "s3"
+
+    def __init__(self, endpoint=None, bucket=None, region=None, access_key=None, secret_key=None,
+                 prefix=None, public_url=None, max_workers=8, max_retries=3):
+        super().__init__(max_workers=max_workers)
+        self.endpoint = (endpoint or os.environ.get("SHELLAGENT_S3_ENDPOINT", "https://s3.amazonaws.com")).rstrip("/")
+        self.bucket = bucket or os.environ.get("SHELLAGENT_S3_BUCKET")
+        self.region = region or os.environ.get("SHELLAGENT_S3_REGION", "us-east-1")
+        self.access_key = access_key or os.environ.get("AWS_ACCESS_KEY_ID")
+        self.secret_key = secret_key or os.environ.get("AWS_SECRET_ACCESS_KEY")
+        self.prefix = prefix if prefix is not None else os.environ.get("SHELLAGENT_S3_PREFIX", "shellagent/")
+        self.public_url = (public_url or os.environ.get("SHELLAGENT_S3_PUBLIC_URL") or "").rstrip("/") or None
+        if not self.bucket or not self.access_key or not self.secret_key:
+            raise ValueError("the s3 storage backend needs SHELLAGENT_S3_BUCKET, AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY")
+        self.session = requests.Session()
+        retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=["HEAD", "PUT"], raise_on_status=False)
+        adapter = HTTPAdapter(pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def ledger_url(self, local_file):
+        return f"s3://{self.bucket}@{self.endpoint}"
+
+    def object_key(self, sha256sum, ext):
+        return f"{self.prefix}{sha256sum}{ext.lower()}"
+
+    def object_url(self, key):
+        return f"{self.endpoint}/{self.bucket}/{quote(key)}"
+
+    def public_url_for(self, key):
+        if self.public_url is not None:
+            return f"{self.public_url}/{quote(key)}"
+        return self.object_url(key)
+
+    def _request(self, method, key, payload_hash, headers=None, **kwargs):
+        url = self.object_url(key)
+        headers = sign_request_v4(method, url, headers or {}, payload_hash, self.access_key, self.secret_key, self.region)
+        return self.session.request(method, url, headers=headers, timeout=(3.05, 300), **kwargs)
+
+    def find_stored(self, local_file, sha256sum):
+        key = self.object_key(sha256sum, os.path.splitext(local_file)[1])
+        response = self._request("HEAD", key, hashlib.sha256(b"").hexdigest())
+        return self.public_url_for(key) if response.status_code == 200 else None
+
+    def upload_file(self, local_file):
+        sha256sum = get_hash_cache().get_or_compute(local_file)
+        ext = os.path.splitext(local_file)[1]
+        key = self.object_key(sha256sum, ext)
+        if self.find_stored(local_file, sha256sum) is None:
+            size = os.path.getsize(local_file)
+            with open(local_file, "rb") as f:
+                response = self._request("PUT", key, sha256sum, data=f, headers={
+                    "Content-Type": ext_to_type.get(ext.lower(), "application/octet-stream"),
+                    "Content-Length": str(size),
+                })
+            if response.status_code != 200:
+                raise Exception(f"[HTTP ERROR] {response.status_code} - {response.text} \n")
+        else:
+            size = None
+        return sha256sum, self.public_url_for(key), size
+
+
+STORAGE_BACKENDS = {
+    "http": HTTPStoreBackend,
+    "local": LocalStorageBackend,
+    "s3": S3StorageBackend,
+}
+
+_storage_backend = None
+_storage_backend_lock = threading.Lock()
+
+
+def get_storage_backend():
+    global _storage_backend
+    with _storage_backend_lock:
+        if _storage_backend is None:
+            if STORAGE_BACKEND not in STORAGE_BACKENDS:
+                raise ValueError(f"unknown storage backend `{STORAGE_BACKEND}`, expected one of {list(STORAGE_BACKENDS)}")
+            _storage_backend = STORAGE_BACKENDS[STORAGE_BACKEND]()
+            logging.info(f"uploading local files to the `{STORAGE_BACKEND}` storage backend")
+        return _storage_backend
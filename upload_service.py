@@ -0,0 +1,252 @@
+"""
+Long-lived asynchronous upload service. One aiohttp session on a background
+event loop keeps connections to the store alive between exports; uploads
+run concurrently under a global and a per-host limit, retry transient
+failures with exponential backoff and jitter, and the first file that fails
+for good cancels its siblings. Every call returns one report per file.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from functools import partial
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+
+from .file_upload import (
+    STORE_URL, CHUNKED_UPLOAD_URL, MultipartFileStream, ext_to_type, find_uploaded, get_store_headers,
+    record_upload, upload_file_chunked, use_chunked_upload,
+)
+from .utils.hash_cache import get_hash_cache
+
+UPLOAD_CONCURRENCY = int(os.environ.get("SHELLAGENT_UPLOAD_CONCURRENCY", 8))
+UPLOAD_PER_HOST = int(os.environ.get("SHELLAGENT_UPLOAD_PER_HOST", 4))
+UPLOAD_RETRIES = int(os.environ.get("SHELLAGENT_UPLOAD_RETRIES", 3))
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+READ_CHUNK_SIZE = 1024 ** 2
+
+
+class UploadError(Exception):
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report or []
+
+
+class RetryableUploadError(Exception):
+    pass
+
+
+class UploadService:
+    def __init__(self, server_url=None, chunked_url=CHUNKED_UPLOAD_URL, max_concurrency=UPLOAD_CONCURRENCY, per_host_limit=UPLOAD_PER_HOST,
+                 max_retries=UPLOAD_RETRIES, backoff_factor=0.5, max_backoff=30,
+                 timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=120)):
+        self.server_url = server_url
+        self.chunked_url = chunked_url  # receiver of resumable chunked uploads for large files, if any
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._semaphore = None
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="shellagent-upload", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _get_session(self):
+        # created on the service loop, which owns the pooled connections
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host_limit, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    def backoff(self, attempt):
+        # "full jitter": a random wait up to the exponential cap, so retries of many files spread out
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    async def _post_file(self, session, server_url, local_file):
+        loop = asyncio.get_running_loop()
+        ext = os.path.splitext(local_file)[1]
+        with MultipartFileStream(local_file, "file", os.path.basename(local_file), ext_to_type[ext.lower()]) as body:
+            async def chunks():
+                while True:
+                    chunk = await loop.run_in_executor(None, body.read, READ_CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+            headers = get_store_headers()
+            headers["Content-Type"] = body.content_type
+            headers["Content-Length"] = str(len(body))
+            async with session.post(server_url, data=chunks(), headers=headers) as response:
+                text = await response.text()
+                if response.status in RETRY_STATUSES:
+                    raise RetryableUploadError(f"[HTTP ERROR] {response.status} - {text}")
+                if response.status != 200:
+                    raise UploadError(f"[HTTP ERROR] {response.status} - {text}")
+                url = (await response.json(content_type=None))["url"]
+            return body.hexdigest(), url, body.file_size
+
+    async def _post_file_chunked(self, server_url, local_file):
+        cancel_event = threading.Event()
+        future = asyncio.get_running_loop().run_in_executor(
+            None, partial(upload_file_chunked, local_file, server_url, cancel_event=cancel_event))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # the chunks sent so far are kept, the next export resumes from them;
+            # the uploading thread stops after its current chunk and is waited for
+            cancel_event.set()
+            await asyncio.wait([future])
+            raise
+
+    async def _upload_one(self, filename, source_path, target_path, is_abs, server_url, call_semaphore, on_done):
+        loop = asyncio.get_running_loop()
+        report = {
+            "filename": filename, "source_path": source_path, "target_path": target_path,
+            "status": "pending", "sha256": None, "url": None, "bytes": 0, "attempts": 0, "seconds": 0.0, "error": None,
+        }
+        start = time.time()
+        try:
+            chunked = self.chunked_url is not None and await loop.run_in_executor(None, use_chunked_upload, source_path, self.chunked_url)
+            if chunked:
+                server_url = self.chunked_url
+            sha256sum, url = await loop.run_in_executor(None, find_uploaded, source_path, server_url)
+            if url is not None:
+                report.update(status="cached", sha256=sha256sum, url=url)
+                return report
+            stat_key = await loop.run_in_executor(None, get_hash_cache().stat_key, source_path)
+            session = self._get_session()
+            async with call_semaphore, self._semaphore, self._host_semaphore(server_url):
+                for attempt in range(self.max_retries + 1):
+                    report["attempts"] = attempt + 1
+                    try:
+                        if chunked:
+                            sha256sum, url, size = await self._post_file_chunked(server_url, source_path)
+                        else:
+                            sha256sum, url, size = await self._post_file(session, server_url, source_path)
+                        break
+                    except (aiohttp.ClientError, asyncio.TimeoutError, RetryableUploadError,
+                            requests.ConnectionError, requests.Timeout) as e:
+                        if attempt == self.max_retries:
+                            raise UploadError(f"{e} (after {attempt + 1} attempts)")
+                        delay = self.backoff(attempt)
+                        logging.warning(f"upload of {source_path} failed ({e}), retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+            await loop.run_in_executor(None, record_upload, source_path, server_url, sha256sum, url, stat_key, size)
+            report.update(status="uploaded", sha256=sha256sum, url=url, bytes=size)
+            return report
+        except asyncio.CancelledError:
+            report["status"] = "cancelled"
+            raise
+        except Exception as e:
+            report.update(status="failed", error=str(e))
+            raise UploadError(f"Error processing {filename}: {e}", [report])
+        finally:
+            report["seconds"] = time.time() - start
+            on_done(report)
+
+    async def _upload_many(self, items, server_url, max_concurrency, on_done):
+        call_semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        tasks = [
+            asyncio.ensure_future(self._upload_one(filename, *item, server_url, call_semaphore, on_done))
+            for filename, item in items
+        ]
+        try:
+            for future in asyncio.as_completed(tasks):
+                await future
+        finally:
+            # fail fast: one failure (or the caller giving up) cancels the uploads still running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def upload_many(self, mapping_dict, max_concurrency=None, progress_callback=None, cancel_event=None):
+        """Upload {filename: (source_path, target_path, is_abs)}; returns one report per file.
+
+        progress_callback(done, total) runs on the calling thread, if it raises
+        the remaining uploads are cancelled and the exception propagates. Setting
+        `cancel_event` cancels them too, with an UploadError."""
+        server_url = self.server_url or STORE_URL
+        items = list(mapping_dict.items())
+        reports = {}
+        events = queue.Queue()
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(
+            self._upload_many(items, server_url, max_concurrency, events.put), loop
+        )
+        try:
+            while len(reports) < len(items):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise UploadError("upload cancelled")
+                try:
+                    report = events.get(timeout=0.1)
+                except queue.Empty:
+                    if future.done() and events.empty():
+                        break
+                    continue
+                reports[report["filename"]] = report
+                if progress_callback is not None and report["status"] in ("uploaded", "cached"):
+                    progress_callback(sum(r["status"] in ("uploaded", "cached") for r in reports.values()), len(items))
+            future.result()
+        except BaseException as e:
+            future.cancel()
+            try:
+                future.result(timeout=30)
+            except BaseException:
+                pass
+            while not events.empty():
+                report = events.get()
+                reports[report["filename"]] = report
+            report_list = [reports.get(filename, {"filename": filename, "status": "cancelled"}) for filename, _ in items]
+            if isinstance(e, UploadError):
+                raise UploadError(str(e), report_list) from e
+            raise
+        return [reports[filename] for filename, _ in items]
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+            self._loop = self._session = self._semaphore = None
+            self._host_semaphores = {}
+
+
+_upload_service = None
+_upload_service_lock = threading.Lock()
+
+
+def get_upload_service():
+    global _upload_service
+    with _upload_service_lock:
+        if _upload_service is None:
+            _upload_service = UploadService()
+            atexit.register(_upload_service.close)
+        return _upload_service
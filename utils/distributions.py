@@ -0,0 +1,121 @@
+"""
+Installed distributions and custom-node requirement files, read once and
+cached: the distribution snapshot is rebuilt only when a directory on
+sys.path changes (installing or removing a package touches its
+site-packages dir), requirement files are re-parsed only when they change.
+"""
+import os
+import re
+import sys
+import threading
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:  # python < 3.8
+    importlib_metadata = None
+
+
+def normalize_name(name):
+    # PEP 503: case-insensitive, runs of "-", "_" and "." are equivalent
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def strip_extras(package_name):
+    return package_name.split("[", 1)[0].strip()
+
+
+class DistributionSnapshot:
+    """normalised name -> version of every installed distribution."""
+
+    def __init__(self):
+        self._versions = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _current_signature(self):
+        signature = []
+        for path in sys.path:
+            try:
+                signature.append((path, os.stat(path or ".").st_mtime_ns))
+            except OSError:
+                signature.append((path, None))
+        return tuple(signature)
+
+    def _build(self):
+        versions = {}
+        if importlib_metadata is not None:
+            for dist in importlib_metadata.distributions():
+                name = dist.metadata["Name"]
+                # the first distribution found on sys.path wins, as with importlib.metadata.version
+                if name and normalize_name(name) not in versions:
+                    versions[normalize_name(name)] = dist.version
+        else:
+            import pkg_resources
+            for dist in pkg_resources.working_set:
+                versions.setdefault(normalize_name(dist.project_name), dist.version)
+        return versions
+
+    def versions(self):
+        """The snapshot, rebuilt first if sys.path or one of its directories changed."""
+        signature = self._current_signature()
+        with self._lock:
+            if self._versions is None or signature != self._signature:
+                self._versions = self._build()
+                self._signature = signature
+            return self._versions
+
+    def version(self, package_name, versions=None):
+        """Installed version of a requirement name like `Foo_Bar[extra]`, or None."""
+        if versions is None:
+            versions = self.versions()
+        return versions.get(normalize_name(strip_extras(package_name)))
+
+
+def split_package_version(require_line):
+    require_line = require_line.strip()
+
+    pattern = r"^([a-zA-Z0-9_\-\[\]]+)(.*)$"
+    match = re.match(pattern, require_line.strip())
+
+    if match:
+        package_name = match.group(1)  # First capturing group is the package name
+        version_specifier = match.group(2) if match.group(2) else ""  # Second group is the version, if present
+        return package_name, version_specifier
+    else:
+        assert len(require_line) == 0 or require_line.strip()[0] == "#", require_line
+        return None, None
+
+
+_requirements_cache = {}  # path -> ((mtime_ns, size), [(package_name, version_specifier), ...])
+_requirements_lock = threading.Lock()
+
+
+def read_requirements(path):
+    """Parsed lines of a requirements.txt, cached until the file changes; [] if it cannot be read."""
+    try:
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with _requirements_lock:
+            cached = _requirements_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path) as f:
+            lines = f.readlines()
+    except (OSError, UnicodeDecodeError):
+        return []
+    requirements = [split_package_version(line) for line in dict.fromkeys(lines)]
+    with _requirements_lock:
+        _requirements_cache[path] = (key, requirements)
+    return requirements
+
+
+_distribution_snapshot = None
+_distribution_snapshot_lock = threading.Lock()
+
+
+def get_distribution_snapshot():
+    global _distribution_snapshot
+    with _distribution_snapshot_lock:
+        if _distribution_snapshot is None:
+            _distribution_snapshot = DistributionSnapshot()
+        return _distribution_snapshot
@@ -0,0 +1,161 @@
+"""
+Persistent basename -> [paths] index of the model folders.
+
+The directory tree is cached on disk together with the mtime of every
+directory. Re-validating a root only costs one ``stat`` per directory: a
+directory is re-listed only when its own mtime changed, so lookups no longer
+walk the whole ``models`` tree.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from .utils import get_cache_dir
+
+INDEX_VERSION = 1
+# directories modified this close to the scan may change again within the same
+# mtime tick, so they are re-listed on the next refresh (same trick as git's "racy" index entries)
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+class FileNameIndex:
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._lock = threading.RLock()
+        self._dirs = {}  # dir -> {"mtime_ns", "racy", "files", "subdirs"}
+        self._names = None  # basename -> [full paths], rebuilt lazily
+        self._fresh_roots = set()
+        self._dirty = False
+        self._generations = {}  # root -> number of refreshes that found a change, in this process
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self._dirs = data["dirs"]
+        except (OSError, ValueError, KeyError):
+            self._dirs = {}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump({"version": INDEX_VERSION, "dirs": self._dirs}, f)
+                os.replace(tmp_path, self.index_path)
+                self._dirty = False
+            except OSError as e:
+                logging.warning(f"failed to save file index {self.index_path}: {e}")
+
+    def mark_stale(self):
+        # every root is re-validated (one stat per directory) on its next lookup
+        with self._lock:
+            self._fresh_roots.clear()
+
+    def refresh(self, root):
+        root = os.path.normpath(root)
+        with self._lock:
+            changed = False
+            visited = set()
+            seen_inodes = set()
+            stack = [root]
+            while stack:
+                dir_path = stack.pop()
+                try:
+                    st = os.stat(dir_path)
+                except OSError:
+                    continue
+                if (st.st_dev, st.st_ino) in seen_inodes:  # symlink loop
+                    continue
+                seen_inodes.add((st.st_dev, st.st_ino))
+                mtime_ns = st.st_mtime_ns
+                visited.add(dir_path)
+                entry = self._dirs.get(dir_path)
+                if entry is None or entry["racy"] or entry["mtime_ns"] != mtime_ns:
+                    new_entry = self._scan_dir(dir_path, mtime_ns)
+                    if entry is None or new_entry["files"] != entry["files"] or new_entry["subdirs"] != entry["subdirs"]:
+                        changed = True
+                    entry = self._dirs[dir_path] = new_entry
+                    self._dirty = True
+                stack.extend(os.path.join(dir_path, name) for name in entry["subdirs"])
+
+            prefix = root + os.sep
+            for dir_path in [d for d in self._dirs if d == root or d.startswith(prefix)]:
+                if dir_path not in visited:
+                    del self._dirs[dir_path]
+                    changed = True
+                    self._dirty = True
+
+            if changed:
+                self._names = None
+                self._generations[root] = self._generations.get(root, 0) + 1
+            self._fresh_roots.add(root)
+            return changed
+
+    def generation(self, root):
+        return self._generations.get(os.path.normpath(root), 0)
+
+    @staticmethod
+    def _scan_dir(dir_path, mtime_ns):
+        files, subdirs = [], []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(entry.name)
+                        elif entry.is_file():
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return {
+            "mtime_ns": mtime_ns,
+            "racy": mtime_ns >= time.time_ns() - RACY_WINDOW_NS,
+            "files": sorted(files),
+            "subdirs": sorted(subdirs),
+        }
+
+    def _build_names(self):
+        names = {}
+        for dir_path, entry in self._dirs.items():
+            for name in entry["files"]:
+                names.setdefault(name, []).append(os.path.join(dir_path, name))
+        self._names = names
+
+    def lookup(self, filename, root):
+        """Return the files under `root` whose path ends with `filename`."""
+        root = os.path.normpath(root)
+        rel = os.path.normpath(filename.replace("\\", "/"))
+        with self._lock:
+            if root not in self._fresh_roots:
+                self.refresh(root)
+            if self._names is None:
+                self._build_names()
+            candidates = self._names.get(os.path.basename(rel), [])
+        prefix = root + os.sep
+        return [
+            full_path for full_path in candidates
+            if full_path.startswith(prefix) and full_path.endswith(os.sep + rel)
+        ]
+
+
+_model_index = None
+_model_index_lock = threading.Lock()
+
+
+def get_model_index():
+    global _model_index
+    with _model_index_lock:
+        if _model_index is None:
+            _model_index = FileNameIndex(os.path.join(get_cache_dir(), "file_index.json"))
+        return _model_index
@@ -0,0 +1,137 @@
+"""
+Pure-Python reader for the git metadata needed by inspect_repo_version.
+
+HEAD, loose refs, packed-refs and the remote url are read straight from the
+git directory (including worktrees and `.git` gitdir files), and results are
+cached until one of the files they were read from changes.
+"""
+import os
+import re
+import threading
+
+SHA_PATTERN = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+
+def find_git_dirs(repo_path):
+    """Return (git_dir, common_dir) of the working tree at `repo_path`, or None."""
+    dot_git = os.path.join(repo_path, ".git")
+    if os.path.isdir(dot_git):
+        git_dir = dot_git
+    elif os.path.isfile(dot_git):
+        # worktrees and submodules: ".git" is a file containing "gitdir: <path>"
+        with open(dot_git) as f:
+            content = f.read().strip()
+        if not content.startswith("gitdir:"):
+            return None
+        git_dir = os.path.normpath(os.path.join(repo_path, content[len("gitdir:"):].strip()))
+    else:
+        return None
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir_file):
+        with open(commondir_file) as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    return git_dir, common_dir
+
+
+def _read_packed_ref(common_dir, ref):
+    try:
+        with open(os.path.join(common_dir, "packed-refs")) as f:
+            for line in f:
+                if line.startswith(("#", "^")):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except OSError:
+        pass
+    return None
+
+
+def resolve_ref(git_dir, common_dir, ref, depth=0):
+    if depth > 5:
+        return None
+    for base_dir in (git_dir, common_dir):
+        ref_file = os.path.join(base_dir, ref)
+        if os.path.isfile(ref_file):
+            with open(ref_file) as f:
+                content = f.read().strip()
+            if content.startswith("ref:"):
+                return resolve_ref(git_dir, common_dir, content[len("ref:"):].strip(), depth + 1)
+            return content if SHA_PATTERN.match(content) else None
+    return _read_packed_ref(common_dir, ref)
+
+
+def read_head_commit(git_dir, common_dir):
+    return resolve_ref(git_dir, common_dir, "HEAD")
+
+
+def read_remote_url(common_dir, remote="origin"):
+    # git config lines are usually tab-indented, which configparser would read as continuations
+    section = None
+    try:
+        with open(os.path.join(common_dir, "config")) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    section = line[1:line.find("]")].strip()
+                elif section == f'remote "{remote}"' and "=" in line:
+                    key, value = line.split("=", 1)
+                    if key.strip().lower() == "url":
+                        return value.strip().strip('"')
+    except OSError:
+        pass
+    return None
+
+
+def _watched_files(git_dir, common_dir):
+    files = [
+        os.path.join(git_dir, "HEAD"),
+        os.path.join(common_dir, "packed-refs"),
+        os.path.join(common_dir, "config"),
+    ]
+    try:
+        with open(files[0]) as f:
+            head = f.read().strip()
+        if head.startswith("ref:"):
+            ref = head[len("ref:"):].strip()
+            files += [os.path.join(git_dir, ref), os.path.join(common_dir, ref)]
+    except OSError:
+        pass
+    return files
+
+
+def _stat_signature(files):
+    signature = []
+    for path in files:
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def read_repo_info(repo_path):
+    """Return {"repo": remote url, "commit": HEAD sha}, or None if `repo_path` is not a git checkout."""
+    git_dirs = find_git_dirs(repo_path)
+    if git_dirs is None:
+        return None
+    git_dir, common_dir = git_dirs
+    files = _watched_files(git_dir, common_dir)
+    signature = _stat_signature(files)
+    with _cache_lock:
+        cached = _cache.get(repo_path)
+    if cached is not None and cached[0] == (files, signature):
+        return dict(cached[1])
+    info = {
+        "repo": read_remote_url(common_dir),
+        "commit": read_head_commit(git_dir, common_dir),
+    }
+    with _cache_lock:
+        _cache[repo_path] = ((files, signature), info)
+    return dict(info)
@@ -0,0 +1,125 @@
+"""
+Merkle-style structural fingerprints of workflow_api prompts.
+
+Every node gets a local digest (class_type + canonicalised inputs, with links
+reduced to their output slot) and a structural digest that also folds in the
+structural digests of its upstream nodes. Two nodes with the same structural
+digest compute the same thing, whatever their ids, and changing one node
+only invalidates the digests downstream of it.
+"""
+import hashlib
+import json
+
+
+def is_link(value):
+    # workflow_api links look like ["<node id>", <output slot>]
+    return isinstance(value, (list, tuple)) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int)
+
+
+def canonicalize(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def local_digest(node_info):
+    inputs = {
+        name: ["__link__", value[1]] if is_link(value) else value
+        for name, value in node_info.get("inputs", {}).items()
+    }
+    data = canonicalize({"class_type": node_info.get("class_type"), "inputs": inputs})
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class GraphFingerprint:
+    def __init__(self, prompt):
+        self.prompt = dict(prompt)
+        self._local = {}
+        self._digests = {}
+        self._downstream = {}
+        for node_id, node_info in self.prompt.items():
+            self._add_edges(node_id, node_info)
+
+    def _upstream(self, node_info):
+        return [
+            (name, value[0], value[1])
+            for name, value in sorted(node_info.get("inputs", {}).items())
+            if is_link(value)
+        ]
+
+    def _add_edges(self, node_id, node_info):
+        for _, upstream_id, _ in self._upstream(node_info):
+            self._downstream.setdefault(upstream_id, set()).add(node_id)
+
+    def _remove_edges(self, node_id, node_info):
+        for _, upstream_id, _ in self._upstream(node_info):
+            self._downstream.get(upstream_id, set()).discard(node_id)
+
+    def _local_digest(self, node_id):
+        if node_id not in self._local:
+            self._local[node_id] = local_digest(self.prompt[node_id])
+        return self._local[node_id]
+
+    def node_digest(self, node_id):
+        """Structural digest of `node_id` and everything upstream of it."""
+        # iterative post-order walk, so deep graphs do not hit the recursion limit
+        stack = [(node_id, False)]
+        in_progress = set()
+        while stack:
+            current, children_done = stack.pop()
+            if current in self._digests:
+                continue
+            if current not in self.prompt:
+                self._digests[current] = hashlib.sha256(f"missing:{current}".encode()).hexdigest()
+                continue
+            upstream = self._upstream(self.prompt[current])
+            if not children_done:
+                if current in in_progress:
+                    raise ValueError(f"cycle detected at node {current}")
+                in_progress.add(current)
+                stack.append((current, True))
+                stack.extend((upstream_id, False) for _, upstream_id, _ in upstream if upstream_id not in self._digests)
+                continue
+            h = hashlib.sha256(self._local_digest(current).encode())
+            for name, upstream_id, slot in upstream:
+                if upstream_id not in self._digests:
+                    raise ValueError(f"cycle detected at node {current}")
+                h.update(f"|{name}:{slot}:{self._digests[upstream_id]}".encode())
+            self._digests[current] = h.hexdigest()
+            in_progress.discard(current)
+        return self._digests[node_id]
+
+    def digests(self):
+        return {node_id: self.node_digest(node_id) for node_id in self.prompt}
+
+    def graph_digest(self):
+        """Digest of the whole prompt, independent of node ids."""
+        h = hashlib.sha256()
+        for digest in sorted(self.digests().values()):
+            h.update(digest.encode())
+        return h.hexdigest()
+
+    def _invalidate(self, node_id):
+        stack = [node_id]
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            self._digests.pop(current, None)
+            stack.extend(self._downstream.get(current, ()))
+
+    def update_node(self, node_id, node_info):
+        """Replace (or add) one node; only digests downstream of it are recomputed."""
+        if node_id in self.prompt:
+            self._remove_edges(node_id, self.prompt[node_id])
+        self.prompt[node_id] = node_info
+        self._add_edges(node_id, node_info)
+        self._local.pop(node_id, None)
+        self._invalidate(node_id)
+
+    def remove_node(self, node_id):
+        if node_id not in self.prompt:
+            return
+        self._remove_edges(node_id, self.prompt.pop(node_id))
+        self._local.pop(node_id, None)
+        self._invalidate(node_id)
@@ -0,0 +1,124 @@
+"""
+Central sha256 cache shared by every ComfyUI worker on the machine.
+
+Entries are keyed by the real path of the file and are only trusted while
+(size, mtime_ns, inode) still match, so replacing a checkpoint in place is
+detected and the file is re-hashed. The database lives in the plugin cache
+dir, which keeps exports fast on read-only model mounts.
+
+A second table maps quick fingerprints (size + sampled blocks) to sha256, so
+files that were already hashed under another path or mount are recognised
+without reading them in full.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .utils import get_cache_dir, compute_sha256
+from .hashing import quick_fingerprint
+
+
+class HashCache:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_hashes ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                "sha256 TEXT NOT NULL, updated_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "fingerprint TEXT PRIMARY KEY, sha256 TEXT NOT NULL, updated_at REAL)"
+            )
+
+    def _connect(self):
+        # sqlite connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")  # concurrent readers across processes
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(path):
+        real_path = os.path.realpath(path)
+        st = os.stat(real_path)
+        return real_path, (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def stat_key(self, path):
+        """(size, mtime_ns, inode) the entry of `path` is validated against."""
+        return self._key(path)[1]
+
+    def lookup(self, path):
+        """Return the cached sha256 of `path`, or None if unknown or stale."""
+        try:
+            real_path, stat_key = self._key(path)
+        except OSError:
+            return None
+        row = self._connect().execute(
+            "SELECT size, mtime_ns, inode, sha256 FROM file_hashes WHERE path = ?", (real_path,)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != stat_key:
+            return None
+        return row[3]
+
+    def store(self, path, sha256, stat_key=None):
+        real_path, current_key = self._key(path)
+        if stat_key is not None and stat_key != current_key:
+            # the file changed while it was being hashed
+            logging.warning(f"{path} changed during hashing, not caching its sha256")
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, sha256, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (real_path, *current_key, sha256, time.time()),
+            )
+
+    def lookup_fingerprint(self, fingerprint):
+        row = self._connect().execute(
+            "SELECT sha256 FROM fingerprints WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def store_fingerprint(self, fingerprint, sha256):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (fingerprint, sha256, updated_at) VALUES (?, ?, ?)",
+                (fingerprint, sha256, time.time()),
+            )
+
+    def get_or_compute(self, path, compute=compute_sha256, use_fingerprint=False):
+        sha256 = self.lookup(path)
+        if sha256 is not None:
+            return sha256
+        _, stat_key = self._key(path)
+        fingerprint = None
+        if use_fingerprint:
+            # a file we have seen before (e.g. on a freshly mounted volume) skips the full hash
+            fingerprint = quick_fingerprint(path)
+            sha256 = self.lookup_fingerprint(fingerprint)
+        if sha256 is None:
+            sha256 = compute(path)
+            if fingerprint is not None:
+                self.store_fingerprint(fingerprint, sha256)
+        self.store(path, sha256, stat_key=stat_key)
+        return sha256
+
+
+_hash_cache = None
+_hash_cache_lock = threading.Lock()
+
+
+def get_hash_cache():
+    global _hash_cache
+    with _hash_cache_lock:
+        if _hash_cache is None:
+            _hash_cache = HashCache(os.path.join(get_cache_dir(), "hash_cache.sqlite3"))
+        return _hash_cache
@@ -0,0 +1,231 @@
+"""
+File hashing for the plugin: a single-file hash engine and a parallel
+hashing stage with a shared read-bandwidth cap.
+"""
+import hashlib
+import io
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+CHUNK_SIZE_CANDIDATES = [256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 8 * 1024 ** 2]
+
+
+def benchmark_chunk_size(candidates=CHUNK_SIZE_CANDIDATES, sample_size=16 * 1024 ** 2, algorithm="sha256"):
+    """Pick the chunk size with the lowest per-byte overhead on this machine."""
+    sample = bytes(sample_size)
+    timings = {}
+    for chunk_size in candidates:
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        source = io.BytesIO(sample)
+        h = hashlib.new(algorithm)
+        start = time.perf_counter()
+        while n := source.readinto(buffer):
+            h.update(view[:n])
+        timings[chunk_size] = time.perf_counter() - start
+    return min(timings, key=timings.get)
+
+
+class HashEngine:
+    """Hashes files through a preallocated per-thread buffer (or mmap), so
+    memory stays flat regardless of the file size."""
+
+    def __init__(self, chunk_size=None, use_mmap=False):
+        self._chunk_size = chunk_size
+        self.use_mmap = use_mmap
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def chunk_size(self):
+        if self._chunk_size is None:
+            with self._lock:
+                if self._chunk_size is None:
+                    self._chunk_size = benchmark_chunk_size()
+                    logging.info(f"hash engine chunk size: {self._chunk_size}")
+        return self._chunk_size
+
+    def _buffer(self, chunk_size):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) != chunk_size:
+            buffer = bytearray(chunk_size)
+            self._local.buffer = buffer
+        return buffer
+
+    def hash_file(self, file_path, algorithm="sha256", chunk_size=None, on_chunk=None):
+        chunk_size = chunk_size or self.chunk_size
+        h = hashlib.new(algorithm)
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if self.use_mmap and size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    with memoryview(mm) as view:
+                        for offset in range(0, size, chunk_size):
+                            with view[offset:offset + chunk_size] as chunk:
+                                h.update(chunk)
+                                n = len(chunk)
+                            if on_chunk is not None:
+                                on_chunk(n)
+            else:
+                buffer = self._buffer(chunk_size)
+                with memoryview(buffer) as view:
+                    while n := f.readinto(buffer):
+                        h.update(view[:n])
+                        if on_chunk is not None:
+                            on_chunk(n)
+        return h.hexdigest()
+
+
+_hash_engine = None
+_hash_engine_lock = threading.Lock()
+
+
+def get_hash_engine():
+    global _hash_engine
+    with _hash_engine_lock:
+        if _hash_engine is None:
+            chunk_size = int(os.environ.get("SHELLAGENT_HASH_CHUNK_SIZE", 0)) or None
+            use_mmap = os.environ.get("SHELLAGENT_HASH_MMAP", "0") == "1"
+            _hash_engine = HashEngine(chunk_size=chunk_size, use_mmap=use_mmap)
+        return _hash_engine
+
+
+def quick_fingerprint(file_path, block_size=64 * 1024, sample_stride=32 * 1024 ** 2, min_samples=8):
+    """Size plus a hash of the head, the tail and evenly spaced blocks.
+
+    One block is sampled every `sample_stride` bytes (at least `min_samples`),
+    so files that differ in a region larger than the stride (e.g. two
+    checkpoints with a different baked-in VAE) never share a fingerprint.
+    It reads about size / 512 bytes with the defaults, a few MB on multi-GB
+    checkpoints. It identifies files we have already fully hashed, it does
+    not replace the sha256.
+    """
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        num_samples = max(min_samples, size // sample_stride)
+        if size <= (num_samples + 2) * block_size:
+            offsets = [0]
+            block_size = size
+        else:
+            step = (size - block_size) // (num_samples + 1)
+            offsets = [i * step for i in range(num_samples + 1)] + [size - block_size]
+        for offset in offsets:
+            f.seek(offset)
+            h.update(f.read(block_size))
+    # the sampling is part of the key, fingerprints taken with other settings never match
+    return f"{size}:{sample_stride}:{h.hexdigest()}"
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all hashing workers."""
+
+    def __init__(self, bytes_per_sec, burst=None):
+        self.rate = float(bytes_per_sec)
+        self.capacity = float(burst or bytes_per_sec)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _FileProgress:
+    def __init__(self, path, index, total, progress_callback, interval=0.5):
+        self.path = path
+        self.index = index
+        self.total = total
+        self.progress_callback = progress_callback
+        self.interval = interval
+        try:
+            self.bytes_total = os.path.getsize(path)
+        except OSError:
+            self.bytes_total = 0
+        self.bytes_done = 0
+        self.last_report = 0
+
+    def report(self, status, **extra):
+        if self.progress_callback is None:
+            return
+        self.progress_callback({
+            "path": self.path,
+            "status": status,
+            "index": self.index,
+            "total": self.total,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            **extra,
+        })
+
+    def on_chunk(self, nbytes):
+        self.bytes_done += nbytes
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report("hashing")
+
+
+def hash_files_parallel(paths, hash_fn, max_workers=4, max_bytes_per_sec=None, progress_callback=None, on_result=None,
+                        cancel_event=None):
+    """Hash `paths` concurrently and return {path: digest}.
+
+    `hash_fn(path, on_chunk)` must call `on_chunk(nbytes)` after every read so
+    that the total read bandwidth can be capped and per-file progress reported.
+    `on_result(path, digest)` is called as soon as each file is done. Once
+    `cancel_event` is set the workers stop at their next read.
+    """
+    paths = list(dict.fromkeys(paths))
+    if len(paths) == 0:
+        return {}
+    limiter = BandwidthLimiter(max_bytes_per_sec) if max_bytes_per_sec else None
+    # largest files first keeps all workers busy until the end
+    paths.sort(key=lambda p: os.path.getsize(p) if os.path.isfile(p) else 0, reverse=True)
+    # set when one file fails, so the other workers stop instead of finishing their files
+    stop_event = threading.Event()
+
+    def run(index, path):
+        progress = _FileProgress(path, index, len(paths), progress_callback)
+
+        def on_chunk(nbytes):
+            if stop_event.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                raise CancelledError(f"hashing of {path} cancelled")
+            if limiter is not None:
+                limiter.consume(nbytes)
+            progress.on_chunk(nbytes)
+
+        start = time.time()
+        progress.report("start")
+        digest = hash_fn(path, on_chunk)
+        progress.report("done", elapsed=time.time() - start)
+        return digest
+
+    results = {}
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as executor:
+        futures = {executor.submit(run, index, path): path for index, path in enumerate(paths)}
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if on_result is not None:
+                    on_result(futures[future], results[futures[future]])
+        except BaseException:
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+            raise
+    logging.info(f"hashed {len(paths)} files, time elapsed: {time.time() - start}")
+    return results
@@ -0,0 +1,60 @@
+"""
+model_loader_info.json compiled into a dispatch table: per node class, the
+plain field names go into a dict and the regex ones into one precompiled
+alternation, so a field that matches nothing is rejected in a single lookup
+plus (at most) a single regex call. Results are memoized per (class, field).
+"""
+import re
+
+
+class LoaderFields:
+    """The compiled entries of one loader node class."""
+
+    def __init__(self, items):
+        self.save_paths = [item["save_path"] for item in items]
+        self.exact = {}  # field name -> indices of the entries naming it literally
+        self.patterns = []  # (index, compiled pattern) of the regex entries
+        for index, item in enumerate(items):
+            pattern = item["field_name"]
+            if re.escape(pattern) == pattern:
+                self.exact.setdefault(pattern, []).append(index)
+            else:
+                self.patterns.append((index, re.compile(pattern)))
+        # one alternation rejects the fields no regex entry can match
+        self.combined = re.compile("|".join(f"(?:{rx.pattern})" for _, rx in self.patterns)) if self.patterns else None
+
+    def match(self, field_name):
+        """Save paths of every entry matching `field_name`, in file order."""
+        indices = list(self.exact.get(field_name, ()))
+        if self.combined is not None and self.combined.fullmatch(field_name):
+            indices += [index for index, rx in self.patterns if rx.fullmatch(field_name)]
+        return tuple(self.save_paths[index] for index in sorted(indices))
+
+
+class LoaderDispatchTable:
+    def __init__(self, model_loaders_info, model_suffixes):
+        self.suffixes = tuple(model_suffixes)
+        self.classes = {class_type: LoaderFields(items) for class_type, items in model_loaders_info.items()}
+        self._matches = {}  # (class_type, field_name) -> save paths
+
+    def __contains__(self, class_type):
+        return class_type in self.classes
+
+    def is_model_file(self, filename):
+        return isinstance(filename, str) and filename.endswith(self.suffixes)
+
+    def save_paths(self, class_type, field_name):
+        key = (class_type, field_name)
+        save_paths = self._matches.get(key)
+        if save_paths is None:
+            save_paths = self._matches[key] = self.classes[class_type].match(field_name)
+        return save_paths
+
+    def model_inputs(self, class_type, inputs):
+        """(field name, filename, save path) for every model file input of a loader node;
+        a field matched by several entries yields one item per entry."""
+        for field_name, filename in inputs.items():
+            if not self.is_model_file(filename):
+                continue
+            for save_path in self.save_paths(class_type, field_name):
+                yield field_name, filename, save_path
@@ -0,0 +1,128 @@
+"""
+Compact, memory-mapped sha256 -> urls catalog.
+
+`model_info.json` is converted once into a sorted binary index:
+
+    header:  b"SAMC" | u32 version | u64 count
+    records: count x (32 byte sha256 digest | u64 blob offset | u32 blob length), sorted by digest
+    blob:    utf-8 JSON list of urls for each record
+
+Lookups binary-search the mmapped records, so opening the catalog costs
+neither startup time nor memory, however large it grows.
+
+Build step:
+    python utils/model_catalog.py model_info.json model_info.bin
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+CATALOG_MAGIC = b"SAMC"
+CATALOG_VERSION = 1
+HEADER = struct.Struct("<4sIQ")
+RECORD = struct.Struct("<32sQI")
+MAX_URLS = 10
+
+
+def build_catalog(json_path, out_path):
+    with open(json_path) as f:
+        model_list_json = json.load(f)
+    records = []
+    for model_id, info in model_list_json.items():
+        try:
+            digest = bytes.fromhex(model_id)
+        except ValueError:
+            digest = b""
+        if len(digest) != 32:
+            logging.warning(f"skip catalog entry with invalid sha256: {model_id}")
+            continue
+        urls = [item["url"] for item in info.get("links", [])][:MAX_URLS]
+        records.append((digest, json.dumps(urls).encode()))
+    records.sort(key=lambda record: record[0])
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, len(records)))
+        offset = HEADER.size + RECORD.size * len(records)
+        for digest, blob in records:
+            f.write(RECORD.pack(digest, offset, len(blob)))
+            offset += len(blob)
+        for _, blob in records:
+            f.write(blob)
+    os.replace(tmp_path, out_path)
+    return len(records)
+
+
+class ModelCatalog:
+    def __init__(self, path=None):
+        self._mm = None
+        self.count = 0
+        if path is None:
+            return
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != CATALOG_MAGIC or version != CATALOG_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a model catalog (version {CATALOG_VERSION})")
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, model_id):
+        return self.get_urls(model_id) is not None
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self.count = 0
+
+    def _find(self, digest):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record_digest, offset, length = RECORD.unpack_from(self._mm, HEADER.size + mid * RECORD.size)
+            if record_digest < digest:
+                lo = mid + 1
+            elif record_digest > digest:
+                hi = mid
+            else:
+                return offset, length
+        return None
+
+    def get_urls(self, model_id):
+        """Return the urls of `model_id`, or None if it is not in the catalog."""
+        if self._mm is None:
+            return None
+        try:
+            digest = bytes.fromhex(model_id)
+        except ValueError:
+            return None
+        found = self._find(digest)
+        if found is None:
+            return None
+        offset, length = found
+        return json.loads(self._mm[offset:offset + length])
+
+
+def load_model_catalog(json_path, catalog_path):
+    """Open `catalog_path`, (re)building it first if `json_path` is newer."""
+    json_mtime = os.path.getmtime(json_path) if os.path.isfile(json_path) else None
+    if json_mtime is not None and (not os.path.isfile(catalog_path) or os.path.getmtime(catalog_path) < json_mtime):
+        count = build_catalog(json_path, catalog_path)
+        logging.info(f"built model catalog {catalog_path} with {count} entries")
+    if not os.path.isfile(catalog_path):
+        logging.warning(f"model catalog not found: {json_path}")
+        return ModelCatalog()
+    return ModelCatalog(catalog_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"usage: python {sys.argv[0]} model_info.json model_info.bin")
+        sys.exit(1)
+    print(f"{build_catalog(sys.argv[1], sys.argv[2])} entries written to {sys.argv[2]}")
@@ -0,0 +1,168 @@
+"""
+Header-only introspection of model files.
+
+safetensors files start with a little-endian u64 length followed by a JSON
+table of tensors; GGUF files start with a key/value section followed by the
+tensor infos. Both are read without touching the weights, so dtype, tensor
+count, parameter count and an architecture hint are available without
+loading or hashing the model.
+"""
+import json
+import logging
+import os
+import struct
+from collections import Counter
+from math import prod
+
+SAFETENSORS_MAX_HEADER_SIZE = 100 * 1024 ** 2
+
+# substring of a tensor name -> architecture, the first match wins
+SAFETENSORS_ARCHITECTURE_HINTS = [
+    ("lora_unet_", "lora"),
+    ("lora_te", "lora"),
+    (".lora_up.", "lora"),
+    (".lora_A.", "lora"),
+    ("double_blocks.", "flux"),
+    ("joint_blocks.", "sd3"),
+    ("conditioner.embedders.1.", "sdxl"),
+    ("cond_stage_model.transformer.", "sd1"),
+    ("cond_stage_model.model.", "sd2"),
+    ("control_model.", "controlnet"),
+    ("controlnet_", "controlnet"),
+    ("decoder.up.", "vae"),
+]
+
+GGML_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 6: "Q5_0", 7: "Q5_1", 8: "Q8_0", 9: "Q8_1",
+    10: "Q2_K", 11: "Q3_K", 12: "Q4_K", 13: "Q5_K", 14: "Q6_K", 15: "Q8_K",
+    16: "IQ2_XXS", 17: "IQ2_XS", 18: "IQ3_XXS", 19: "IQ1_S", 20: "IQ4_NL", 21: "IQ3_S",
+    22: "IQ2_S", 23: "IQ4_XS", 24: "I8", 25: "I16", 26: "I32", 27: "I64", 28: "F64",
+    29: "IQ1_M", 30: "BF16",
+}
+
+# GGUF value type -> struct format of the scalar types
+GGUF_SCALAR_FORMATS = {
+    0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i", 6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d",
+}
+GGUF_TYPE_STRING = 8
+GGUF_TYPE_ARRAY = 9
+
+
+def _dominant_dtype(params_per_dtype):
+    if not params_per_dtype:
+        return None
+    return params_per_dtype.most_common(1)[0][0]
+
+
+def read_safetensors_header(file_path):
+    with open(file_path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        if header_size > SAFETENSORS_MAX_HEADER_SIZE:
+            raise ValueError(f"invalid safetensors header size {header_size}")
+        header = json.loads(f.read(header_size))
+    metadata = header.pop("__metadata__", None) or {}
+
+    params_per_dtype = Counter()
+    for tensor in header.values():
+        params_per_dtype[tensor["dtype"]] += prod(tensor["shape"])
+
+    architecture = metadata.get("modelspec.architecture")
+    if architecture is None:
+        for pattern, hint in SAFETENSORS_ARCHITECTURE_HINTS:
+            if any(pattern in name for name in header):
+                architecture = hint
+                break
+    if architecture == "lora" and "ss_base_model_version" in metadata:
+        architecture = f"lora/{metadata['ss_base_model_version']}"
+
+    return {
+        "format": "safetensors",
+        "dtype": _dominant_dtype(params_per_dtype),
+        "tensor_count": len(header),
+        "parameter_count": sum(params_per_dtype.values()),
+        "architecture": architecture,
+    }
+
+
+class _GGUFReader:
+    def __init__(self, f):
+        self.f = f
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.f.read(struct.calcsize(fmt)))[0]
+
+    def string(self):
+        return self.f.read(self.unpack("<Q")).decode("utf-8", errors="replace")
+
+    def skip_string(self):
+        self.f.seek(self.unpack("<Q"), os.SEEK_CUR)
+
+    def value(self, value_type):
+        if value_type == GGUF_TYPE_STRING:
+            return self.string()
+        if value_type == GGUF_TYPE_ARRAY:
+            # arrays (e.g. the tokenizer vocabulary) are skipped, not decoded
+            item_type = self.unpack("<I")
+            count = self.unpack("<Q")
+            if item_type in GGUF_SCALAR_FORMATS:
+                self.f.seek(count * struct.calcsize(GGUF_SCALAR_FORMATS[item_type]), os.SEEK_CUR)
+            else:
+                for _ in range(count):
+                    if item_type == GGUF_TYPE_STRING:
+                        self.skip_string()
+                    else:
+                        self.value(item_type)
+            return None
+        return self.unpack(GGUF_SCALAR_FORMATS[value_type])
+
+
+def read_gguf_header(file_path):
+    with open(file_path, "rb") as f:
+        reader = _GGUFReader(f)
+        if f.read(4) != b"GGUF":
+            raise ValueError("not a GGUF file")
+        version = reader.unpack("<I")
+        if version < 2:
+            raise ValueError(f"unsupported GGUF version {version}")
+        tensor_count = reader.unpack("<Q")
+        kv_count = reader.unpack("<Q")
+        metadata = {}
+        for _ in range(kv_count):
+            key = reader.string()
+            metadata[key] = reader.value(reader.unpack("<I"))
+
+        params_per_dtype = Counter()
+        for _ in range(tensor_count):
+            reader.skip_string()
+            n_dims = reader.unpack("<I")
+            shape = struct.unpack(f"<{n_dims}Q", f.read(8 * n_dims))
+            ggml_type = reader.unpack("<I")
+            reader.unpack("<Q")  # offset
+            params_per_dtype[GGML_TYPES.get(ggml_type, str(ggml_type))] += prod(shape)
+
+    return {
+        "format": "gguf",
+        "dtype": _dominant_dtype(params_per_dtype),
+        "tensor_count": tensor_count,
+        "parameter_count": sum(params_per_dtype.values()),
+        "architecture": metadata.get("general.architecture"),
+    }
+
+
+HEADER_READERS = {
+    ".safetensors": read_safetensors_header,
+    ".sft": read_safetensors_header,
+    ".gguf": read_gguf_header,
+}
+
+
+def read_model_header(file_path):
+    """Return a summary of the model header, or None if the format is unknown or unreadable."""
+    reader = HEADER_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        return None
+    try:
+        return reader(file_path)
+    except Exception as e:
+        logging.warning(f"failed to read model header of {file_path}: {e}")
+        return None
@@ -0,0 +1,73 @@
+"""
+A small dependency graph of stages run on a thread pool. Each stage starts
+as soon as all the stages it depends on have finished, so the total time is
+the critical path instead of the sum of the stages.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class StageCancelled(Exception):
+    pass
+
+
+class StageGraph:
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.timings = {}  # name -> (start, end) relative to the start of run()
+        # set when a stage fails; long running stages poll it (check_cancelled) and stop early
+        self.cancel_event = threading.Event()
+
+    def add(self, name, fn, deps=()):
+        """`fn` is called with the results of `deps` as keyword arguments."""
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"stage `{name}` depends on unknown stage `{dep}`")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise StageCancelled("another stage failed")
+
+    def run(self):
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        start = time.time()
+
+        def run_stage(name, fn, kwargs):
+            stage_start = time.time() - start
+            result = fn(**kwargs)
+            self.timings[name] = (stage_start, time.time() - start)
+            return result
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers or max(1, len(self.stages)), thread_name_prefix="stage")
+        try:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        del pending[name]
+                        kwargs = {dep: results[dep] for dep in deps}
+                        running[executor.submit(run_stage, name, fn, kwargs)] = name
+                if not running:
+                    raise ValueError(f"unsatisfiable stages: {list(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+        except BaseException:
+            # the first failure aborts the graph: stages that did not start yet are dropped,
+            # the running ones are told to stop and waited for, so no work outlives run()
+            self.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        logging.info("stage timings: " + ", ".join(f"{name} {end - begin:.2f}s" for name, (begin, end) in self.timings.items()))
+        return results
@@ -0,0 +1,68 @@
+"""
+Content-addressed record of the files already uploaded to the store:
+(store url, sha256) -> uploaded url. Exports look the sha256 of every local
+file up here first, so unchanged inputs are not uploaded again.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from .utils import get_cache_dir
+
+
+class UploadLedger:
+    def __init__(self, db_path, ttl=None):
+        self.db_path = db_path
+        self.ttl = ttl  # seconds an uploaded url is trusted, None = forever
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "store TEXT NOT NULL, sha256 TEXT NOT NULL, url TEXT NOT NULL, size INTEGER, "
+                "uploaded_at REAL, expires_at REAL, PRIMARY KEY (store, sha256))"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, store, sha256):
+        """The url `sha256` was uploaded to on `store`, or None if unknown or expired."""
+        row = self._connect().execute(
+            "SELECT url, expires_at FROM uploads WHERE store = ? AND sha256 = ?", (store, sha256)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def record(self, store, sha256, url, size=None, ttl=None):
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (store, sha256, url, size, uploaded_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (store, sha256, url, size, now, now + ttl if ttl else None),
+            )
+
+    def forget(self, store, sha256):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM uploads WHERE store = ? AND sha256 = ?", (store, sha256))
+
+
+_upload_ledger = None
+_upload_ledger_lock = threading.Lock()
+
+
+def get_upload_ledger():
+    global _upload_ledger
+    with _upload_ledger_lock:
+        if _upload_ledger is None:
+            ttl = float(os.environ.get("SHELLAGENT_UPLOAD_LEDGER_TTL", 0))
+            _upload_ledger = UploadLedger(os.path.join(get_cache_dir(), "upload_ledger.sqlite3"), ttl=ttl or None)
+        return _upload_ledger
@@ -2,24 +2,32 @@ import hashlib
 import time
 from pathlib import PurePosixPath, Path, PureWindowsPath
 import base64
+import os
 import re
 
+from .hashing import get_hash_engine
+
+
+def get_cache_dir():
+    # persistent caches (indexes, hash databases) live outside the model folders,
+    # which may be mounted read-only
+    cache_dir = os.environ.get(
+        "SHELLAGENT_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"),
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
 def windows_to_linux_path(windows_path):
     return PureWindowsPath(windows_path).as_posix()
 
-def compute_sha256(file_path, chunk_size=1024 ** 2):
-    # Create a new sha256 hash object
+def compute_sha256(file_path, chunk_size=None, on_chunk=None):
+    # on_chunk is used for bandwidth limiting and progress reporting
     start = time.time()
-    sha256 = hashlib.sha256()
     print("start compute sha256 for", file_path)
-    # Open the file in binary mode
-    with open(file_path, 'rb') as file:
-        # Read the file in chunks to handle large files efficiently
-        while chunk := file.read(chunk_size):
-            sha256.update(chunk)
+    sha256 = get_hash_engine().hash_file(file_path, "sha256", chunk_size=chunk_size, on_chunk=on_chunk)
     print("finish compute sha256 for", file_path, f"time: {time.time() - start}")
-    # Return the hexadecimal digest of the hash
-    return sha256.hexdigest()
+    return sha256
 
 
 def get_alphanumeric_hash(input_string: str) -> str: